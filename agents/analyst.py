@@ -1,12 +1,15 @@
-from google import genai
-from tools import audio_tools, memory_tools
+from tools import audio_tools, memory_tools, tracing
+from tools.genai_client import get_genai_client
+from tools.artifact_store import get_artifact_store
+import atexit
 import json
+import os
+import queue
+import threading
+import time
 import uuid
 import datetime
-try:
-    client = genai.Client()
-except Exception as e:
-    client = None
+client = get_genai_client()
 def get_analyst_prompt(transcript, biomarker_data):
     biomarker_str = json.dumps(biomarker_data, indent=2)
     return (
@@ -20,37 +23,134 @@ def get_analyst_prompt(transcript, biomarker_data):
         "4. topics_discussed: A list of the top 3 main topics discussed (e.g., ['Work Stress', 'Weekend Plans', 'Hobby']).\n"
         "5. sentiment_summary: A brief, objective 2-sentence summary of the overall sentiment and vocal characteristics."
     )
-def analyze_and_log_session(transcript, audio_file_path):
+ANALYSIS_QUEUE_SIZE = int(os.getenv("ANALYSIS_QUEUE_SIZE", "8"))
+ANALYSIS_MAX_RETRIES = int(os.getenv("ANALYSIS_MAX_RETRIES", "3"))
+# "unified": one structured-output call returns scores and the profile trait.
+# "split": the original flash analysis call plus a separate pro profile call.
+ANALYST_MODE = os.getenv("ANALYST_MODE", "unified").strip().lower()
+ANALYST_MODEL = os.getenv("ANALYST_MODEL", "gemini-2.5-flash")
+PROFILE_MODEL = os.getenv("PROFILE_MODEL", "gemini-2.5-pro")
+UNIFIED_ANALYSIS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "mood_score": {"type": "NUMBER"},
+        "anxiety_score": {"type": "NUMBER"},
+        "risk_level": {"type": "INTEGER"},
+        "topics_discussed": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "sentiment_summary": {"type": "STRING"},
+        "profile_trait": {
+            "type": "OBJECT",
+            "nullable": True,
+            "properties": {
+                "key": {"type": "STRING"},
+                "value": {"type": "STRING"},
+            },
+            "required": ["key", "value"],
+        },
+    },
+    "required": ["mood_score", "anxiety_score", "risk_level", "topics_discussed", "sentiment_summary"],
+}
+def get_unified_analysis_prompt(transcript, biomarker_data, current_profile):
+    return (
+        get_analyst_prompt(transcript, biomarker_data) + "\n"
+        "6. profile_trait: ONE new hobby, interest, or personality trait that emerged or was reinforced, as an object "
+        "with 'key' and 'value' (e.g. {\"key\": \"Coping Mechanism\", \"value\": \"Uses humor to deflect.\"}), "
+        "or null if nothing new emerged.\n"
+        "The user's current known profile:\n---\n" + json.dumps(current_profile, indent=2) + "\n---"
+    )
+def _clamp(value, low, high, cast=float):
+    value = cast(value)
+    if value != value:  # NaN
+        raise ValueError("score is NaN")
+    return max(low, min(high, value))
+def validate_analysis(data, with_trait=True):
+    """Check and normalize an analysis response. Raises ValueError if unusable.
+    with_trait=False is for split-mode responses, which carry no profile_trait."""
+    if not isinstance(data, dict):
+        raise ValueError("analysis is not a JSON object")
+    try:
+        analysis = {
+            'mood_score': _clamp(data['mood_score'], 1, 10),
+            'anxiety_score': _clamp(data['anxiety_score'], 1, 10),
+            'risk_level': _clamp(round(float(data['risk_level'])), 0, 3, int),
+            'topics_discussed': [str(t) for t in (data.get('topics_discussed') or [])][:3],
+            'sentiment_summary': str(data['sentiment_summary']).strip(),
+        }
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"analysis is missing or has a malformed field: {e}")
+    if not with_trait:
+        return analysis
+    trait = data.get('profile_trait')
+    if isinstance(trait, dict) and str(trait.get('key') or '').strip() and str(trait.get('value') or '').strip():
+        analysis['profile_trait'] = {'key': str(trait['key']).strip(), 'value': str(trait['value']).strip()}
+    else:
+        analysis['profile_trait'] = None
+    return analysis
+def _generate_json(model, prompt, schema=None):
+    config = {"response_mime_type": "application/json"}
+    if schema is not None:
+        config["response_schema"] = schema
+    response = client.models.generate_content(model=model, contents=prompt, config=config)
+    return json.loads(response.text)
+def run_unified_analysis(transcript, biomarkers, user_id=memory_tools.DEFAULT_USER_ID):
+    current_profile = memory_tools.get_user_profile(user_id)
+    prompt = get_unified_analysis_prompt(transcript, biomarkers, current_profile)
+    return validate_analysis(_generate_json(ANALYST_MODEL, prompt, UNIFIED_ANALYSIS_SCHEMA))
+def analyze_and_log_session(transcript, audio, strict=False, biomarkers=None,
+                            user_id=memory_tools.DEFAULT_USER_ID, session_id=None):
+    # audio may be an AudioClip straight from the recorder or a path to a WAV file.
+    # With strict=True a failed analysis call raises instead of logging empty scores,
+    # so callers (the background queue) can retry it.
     if client is None:
         return None
-    session_id = str(uuid.uuid4())
+    session_id = session_id or str(uuid.uuid4())
     timestamp = datetime.datetime.now().isoformat()
-    biomarkers = audio_tools.extract_vocal_biomarkers(audio_file_path)
-    prompt = get_analyst_prompt(transcript, biomarkers)
-    try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash',
-            contents=prompt,
-            config={"response_mime_type": "application/json"}
-        )
-        analysis = json.loads(response.text)
-    except Exception as e:
-        analysis = {}
+    if biomarkers is None:
+        # Typed-text turns have no recording, hence no vocal biomarkers
+        biomarkers = {}
+        if audio is not None:
+            with tracing.span("biomarkers"):
+                biomarkers = audio_tools.extract_vocal_biomarkers(audio)
+    analysis = None
+    with tracing.span("analysis_llm", mode=ANALYST_MODE):
+        if ANALYST_MODE == "unified":
+            try:
+                analysis = run_unified_analysis(transcript, biomarkers, user_id)
+            except Exception as e:
+                print(f"Unified analysis failed ({e}); falling back to split analysis.")
+        if analysis is None:
+            prompt = get_analyst_prompt(transcript, biomarkers)
+            try:
+                analysis = validate_analysis(_generate_json(ANALYST_MODEL, prompt), with_trait=False)
+            except Exception as e:
+                if strict:
+                    raise
+                # Store NULL scores, not zeros: a failed call must not read as a very low mood
+                print(f"Session analysis unavailable ({e}); logging without scores.")
+                analysis = {}
     log_data = {
         'timestamp': timestamp,
         'session_id': session_id,
+        'user_id': user_id,
         'transcript_summary': analysis.get('sentiment_summary', transcript[:100] + "..."),
-        'mood_score': analysis.get('mood_score', 0),
-        'anxiety_score': analysis.get('anxiety_score', 0),
-        'risk_level': analysis.get('risk_level', 0),
+        'mood_score': analysis.get('mood_score'),
+        'anxiety_score': analysis.get('anxiety_score'),
+        'risk_level': analysis.get('risk_level'),
         'jitter_score': biomarkers.get('jitter_local', 0.0),
         'loudness_mean': biomarkers.get('loudness_mean', 0.0)
     }
-    memory_tools.save_daily_log(log_data)
-    update_user_profile_traits(transcript)
+    with tracing.span("db_write"):
+        memory_tools.save_daily_log(log_data)
+    if 'profile_trait' in analysis:
+        # Unified mode already extracted the trait (or found none); no second call
+        trait = analysis['profile_trait']
+        if trait:
+            memory_tools.update_user_profile(trait['key'], trait['value'], user_id)
+    elif analysis:
+        update_user_profile_traits(transcript, user_id)
     return log_data
-def update_user_profile_traits(transcript):
-    current_profile = memory_tools.get_user_profile()
+def update_user_profile_traits(transcript, user_id=memory_tools.DEFAULT_USER_ID):
+    current_profile = memory_tools.get_user_profile(user_id)
     profile_prompt = (
         f"Based on the latest conversation: '{transcript}'\n"
         f"And the user's current known profile: {json.dumps(current_profile, indent=2)}\n"
@@ -59,15 +159,125 @@ def update_user_profile_traits(transcript):
         "Example: {\"key\": \"Coping Mechanism\", \"value\": \"Uses humor to deflect.\"}"
     )
     try:
-        response = client.models.generate_content(
-            model='gemini-2.5-pro',
-            contents=profile_prompt,
-            config={"response_mime_type": "application/json"}
-        )
-        new_trait = json.loads(response.text)
-        memory_tools.update_user_profile(new_trait['key'], new_trait['value'])
+        new_trait = _generate_json(PROFILE_MODEL, profile_prompt)
+        memory_tools.update_user_profile(new_trait['key'], new_trait['value'], user_id)
     except Exception as e:
         pass
+class AnalysisQueue:
+    """
+    Runs analyze_and_log_session on a background thread so the conversation loop
+    can record the next utterance as soon as TTS finishes.
+
+    The queue is bounded: when it is full, submit() waits up to submit_timeout
+    and then analyses the turn inline, which slows the caller down instead of
+    dropping data. Failed analysis calls are retried with exponential backoff;
+    the last attempt logs whatever is available. shutdown() drains pending work.
+    """
+
+    def __init__(self, maxsize=ANALYSIS_QUEUE_SIZE, max_retries=ANALYSIS_MAX_RETRIES,
+                 backoff=1.0, submit_timeout=5.0):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.submit_timeout = submit_timeout
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.retried = 0
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="analysis-worker", daemon=True)
+                self._thread.start()
+
+    def submit(self, transcript, audio, **context):
+        """Queue a turn for analysis; `context` (user_id, session_id) is passed on to
+        analyze_and_log_session. Returns False if it had to run inline."""
+        if self._closed:
+            raise RuntimeError("AnalysisQueue is shut down")
+        self._ensure_started()
+        # A recording saved to disk stays there until its analysis has finished
+        get_artifact_store().acquire(audio)
+        try:
+            self._queue.put((transcript, audio, context, time.perf_counter()), timeout=self.submit_timeout)
+            return True
+        except queue.Full:
+            print("Analysis queue is full; analysing this turn inline.")
+            self._run(transcript, audio, context)
+            return False
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            try:
+                if job is None:
+                    return
+                self._run(*job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, transcript, audio, context, enqueued_at=None):
+        queue_wait = time.perf_counter() - enqueued_at if enqueued_at is not None else 0.0
+        try:
+            with tracing.span("analysis", session_id=context.get('session_id'), queue_wait_s=round(queue_wait, 3)):
+                self._run_attempts(transcript, audio, context)
+        finally:
+            get_artifact_store().release(audio)
+    def _run_attempts(self, transcript, audio, context):
+        biomarkers = None
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                if biomarkers is None:
+                    biomarkers = {}
+                    if audio is not None:
+                        with tracing.span("biomarkers"):
+                            biomarkers = audio_tools.extract_vocal_biomarkers(audio)
+                analyze_and_log_session(transcript, audio, strict=not last_attempt, biomarkers=biomarkers, **context)
+                self.completed += 1
+                return
+            except Exception as e:
+                if last_attempt:
+                    print(f"Session analysis failed: {e}")
+                    return
+                self.retried += 1
+                delay = self.backoff * (2 ** attempt)
+                print(f"Session analysis attempt {attempt + 1} failed ({e}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def shutdown(self, drain=True, timeout=None):
+        """Stop accepting work; with drain=True, finish everything already queued."""
+        if self._closed:
+            return
+        self._closed = True
+        if self._thread is None:
+            return
+        if not drain:
+            try:
+                while True:
+                    job = self._queue.get_nowait()
+                    if job is not None:
+                        get_artifact_store().release(job[1])
+                    self._queue.task_done()
+            except queue.Empty:
+                pass
+        self._queue.put(None)
+        self._thread.join(timeout)
+_analysis_queue = None
+_analysis_queue_lock = threading.Lock()
+def get_analysis_queue():
+    """Process-wide AnalysisQueue; drained automatically at interpreter exit."""
+    global _analysis_queue
+    with _analysis_queue_lock:
+        if _analysis_queue is None or _analysis_queue._closed:
+            _analysis_queue = AnalysisQueue()
+            atexit.register(_analysis_queue.shutdown)
+        return _analysis_queue
 if __name__ == '__main__':
     import sys
     memory_tools.setup_database()
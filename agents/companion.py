@@ -1,120 +1,229 @@
 import datetime
 import time
 import os
-from google import genai
-from tools import stt_tts_tools, memory_tools
-from agents.guardian import guardian_check
-from agents.analyst import analyze_and_log_session
+import uuid
+from tools import audio_tools, stt_tts_tools, memory_tools, startup, tracing
+from agents.guardian import guardian_check, get_crisis_message
+from agents.analyst import get_analysis_queue
+from agents import context_builder
+from tools.artifact_store import ARTIFACT_RETAIN_AUDIO, get_artifact_store
+from tools.genai_client import get_genai_client
 
-try:
-    client = genai.Client()
-except Exception:
-    client = None
+client = get_genai_client()
 
-def get_companion_prompt(transcript: str, history: list, profile: dict) -> str:
+COMPANION_MODEL = os.getenv("COMPANION_MODEL", "gemini-2.5-flash")
+# Transcribe while the user is still speaking instead of after they press Enter
+STT_STREAMING = os.getenv("STT_STREAMING", "1").strip().lower() not in {"0", "false", "no"}
+# Stream the Gemini reply and speak it sentence by sentence
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "1").strip().lower() not in {"0", "false", "no"}
+
+# Fixed lines the loop speaks; pre-rendered into the TTS cache at startup
+SESSION_ENDED_MESSAGE = "Okay, session ended. Take care — I'm here when you need me."
+SESSION_STOPPED_MESSAGE = "Got it. Session ended. Take care — I'm here when you need me."
+NO_AUDIO_MESSAGE = "I didn't catch that. When you're ready, you can try again."
+NO_TRANSCRIPT_MESSAGE = "I didn't quite catch that. Could you try saying it again?"
+GOODBYE_MESSAGE = "Got it. Thanks for checking in today. I'm here tomorrow if you need me!"
+CANNED_PHRASES = [
+    SESSION_ENDED_MESSAGE, SESSION_STOPPED_MESSAGE, NO_AUDIO_MESSAGE,
+    NO_TRANSCRIPT_MESSAGE, GOODBYE_MESSAGE,
+]
+
+def get_companion_request(transcript: str, history: list = None, profile: dict = None,
+                          user_id: str = memory_tools.DEFAULT_USER_ID, context: tuple = None):
+    """
+    Split the companion prompt into (system_instruction, turn_prompt). The
+    instruction holds the behaviour constraints and the profile, which rarely
+    change, so it can be cached across turns; the turn prompt holds recent
+    history and what the user just said. `context` takes a prebuilt
+    (history_str, profile_str) from context_builder.build_companion_context.
+    """
+    if context is not None:
+        history_str, profile_str = context
+    # Without explicit history/profile, fetch a token-budgeted context for user_id
+    elif history is None and profile is None:
+        history_str, profile_str = context_builder.build_companion_context(user_id)
+    else:
+        profile_budget = int(context_builder.CONTEXT_TOKEN_BUDGET * context_builder.PROFILE_BUDGET_SHARE)
+        profile_str = context_builder.format_profile(profile or {}, profile_budget)
+        history_str = context_builder.format_history(
+            history or [], token_budget=context_builder.CONTEXT_TOKEN_BUDGET - context_builder.estimate_tokens(profile_str)
+        )
     # Include language setting in the prompt so the model knows which language to use
     language = os.getenv('language', 'en')
-    language_line = f"Language: {language}\n"
-    history_str = "\n".join([f"- {h[1][:10]}: {h[3]}" for h in history])
-    profile_str = "\n".join([f"- {k}: {v}" for k, v in profile.items()])
-    return (
-        language_line +
-        "You are SerenAI, the user's empathetic best friend and daily wellness companion.\n"
-        "Behavior Constraints:\n"
-        "1. Tone: Be warm, casual, and supportive.\n"
-        "2. Length: Keep responses concise (2-4 sentences max).\n"
-        "3. Goal: Always end with an open-ended follow-up question.\n"
+    system_instruction = (
+        context_builder.get_companion_preamble(language) +
         "Context to Use:\n"
-        "User's Recent History (Last 7 Days):\n" + (history_str or "No recent history available.") + "\n"
         "User's Personality Profile:\n" + (profile_str or "No personality profile established yet.") + "\n"
+    )
+    turn_prompt = (
+        "User's Recent History (Last 7 Days):\n" + (history_str or "No recent history available.") + "\n"
         "User just said: \"" + transcript + "\"\n"
         "Based on the context, give your empathetic response and thoughtful follow-up question."
     )
+    return system_instruction, turn_prompt
+
+def get_companion_prompt(transcript: str, history: list = None, profile: dict = None,
+                         user_id: str = memory_tools.DEFAULT_USER_ID) -> str:
+    """The whole companion prompt as one string (instruction + turn)."""
+    return "".join(get_companion_request(transcript, history, profile, user_id))
+
+def get_companion_config(system_instruction: str) -> dict:
+    """Generation config sending the instruction as system_instruction. It stays
+    identical across a user's turns until their profile changes, so Gemini's
+    implicit caching can reuse it as a prompt prefix."""
+    return {"system_instruction": system_instruction}
+
+def stream_companion_reply(prompt: str, config: dict = None):
+    """Yield the companion reply as text fragments while Gemini generates it."""
+    for chunk in client.models.generate_content_stream(model=COMPANION_MODEL, contents=prompt, config=config):
+        text = getattr(chunk, "text", None)
+        if text:
+            yield text
+
+def speak_streaming_reply(prompt: str, config: dict = None) -> str:
+    """Stream the reply and synthesize it sentence by sentence, so the first
+    audio is ready while the rest is still generating. Returns the full reply
+    text, or "" if streaming failed before anything was spoken."""
+    spoken = []
+    try:
+        sentences = stt_tts_tools.iter_sentences(stream_companion_reply(prompt, config))
+        for i, (sentence, _audio, _mime) in enumerate(stt_tts_tools.speak_text_stream(sentences)):
+            print(f"SerenAI: {sentence}" if i == 0 else f"         {sentence}")
+            spoken.append(sentence)
+    except Exception as e:
+        print(f"Streaming reply error: {e}")
+    return " ".join(spoken)
 
 def run_session_loop():
     if client is None:
         print("Companion Agent Error: Gemini client not initialized.")
         return
+    # Whisper, google.genai and openSMILE load on a background thread while the user starts talking
+    startup.prewarm()
     memory_tools.setup_database()
-    stt_tts_tools.initialize_stt_model()
+    stt_tts_tools.prerender_phrases(CANNED_PHRASES + [get_crisis_message()])
+    analysis_queue = get_analysis_queue()
     print("Initiating SerenAI Daily Check-in")
+    session_id = str(uuid.uuid4())
+    try:
+        _conversation_loop(analysis_queue, session_id)
+    finally:
+        if analysis_queue.pending():
+            print("Finishing analysis of this session...")
+        analysis_queue.shutdown(drain=True)
+        get_artifact_store().close_session(session_id)
+
+def _conversation_loop(analysis_queue, session_id):
     while True:
         # Wait for the user to start the next recording to avoid auto-restart
-        try:
-            start_cmd = input("Press Enter to start recording (or type 'quit' to exit):\n")
-        except Exception:
-            start_cmd = ""
+        # Read through the recorder's stdin reader so the two never compete for a line
+        start_cmd = audio_tools.read_console_line("Press Enter to start recording (or type 'quit' to exit):")
         if isinstance(start_cmd, str) and start_cmd.strip().lower() in {"quit", "exit", "stop", "end"}:
             try:
-                stt_tts_tools.speak_text("Okay, session ended. Take care — I'm here when you need me.")
+                stt_tts_tools.speak_text(SESSION_ENDED_MESSAGE)
             except Exception:
                 pass
             break
 
-        # Record one whole input (user presses Enter when finished). Set a generous max duration.
-        audio_result = audio_tools.record_user_input(duration=600)
-        # audio_result may be (filename, stop_session) or just filename
-        if isinstance(audio_result, tuple):
-            audio_path, stop_session = audio_result
+        with tracing.span("turn", session_id=session_id):
+            if not _run_turn(analysis_queue, session_id):
+                break
+        finish_hint = "pause" if audio_tools.ENDPOINTING else "press Enter"
+        print(f"When you're ready to reply, speak and {finish_hint} when finished...")
+
+def _run_turn(analysis_queue, session_id) -> bool:
+    """One record -> transcribe -> guardian -> reply -> speak turn, each stage
+    traced. Returns False when the session should end."""
+    # Record one whole input (until the user pauses or presses Enter). Set a generous max duration.
+    # The recording stays in memory as an AudioClip; it is only written to disk
+    # (as a per-session artifact) when recordings are retained.
+    transcript = None
+    with tracing.span("record"):
+        if STT_STREAMING:
+            audio_clip, transcript, stop_session = audio_tools.record_user_input_streaming(
+                duration=600, on_partial=lambda text: print(f"  ... {text}"),
+                persist=ARTIFACT_RETAIN_AUDIO, session_id=session_id,
+            )
         else:
-            audio_path = audio_result
-            stop_session = False
+            audio_clip, stop_session = audio_tools.record_user_input(
+                duration=600, persist=ARTIFACT_RETAIN_AUDIO, session_id=session_id
+            )
+    try:
+        return _respond_to_recording(analysis_queue, session_id, audio_clip, transcript, stop_session)
+    finally:
+        # The analysis queue holds its own reference while it still needs the file
+        get_artifact_store().release(audio_clip)
 
-        # If user requested to end the entire session from within the recorder, say goodbye and break
-        if stop_session:
-            try:
-                stt_tts_tools.speak_text("Got it. Session ended. Take care — I'm here when you need me.")
-            except Exception:
-                pass
-            break
+def _respond_to_recording(analysis_queue, session_id, audio_clip, transcript, stop_session) -> bool:
+    # If user requested to end the entire session from within the recorder, say goodbye and break
+    if stop_session:
+        try:
+            stt_tts_tools.speak_text(SESSION_STOPPED_MESSAGE)
+        except Exception:
+            pass
+        return False
 
-        if not audio_path:
-            # No audio captured this round; prompt and continue
-            try:
-                stt_tts_tools.speak_text("I didn't catch that. When you're ready, you can try again.")
-            except Exception:
-                pass
-            continue
+    if audio_clip is None:
+        # No audio captured this round; prompt and continue
+        try:
+            stt_tts_tools.speak_text(NO_AUDIO_MESSAGE)
+        except Exception:
+            pass
+        return True
 
-        # Transcribe the single full-user-input recording
+    # Transcribe the single full-user-input recording (already done when streaming,
+    # unless the streaming segmenter heard nothing in a clip the endpointer kept)
+    if not transcript:
         try:
-            transcript = stt_tts_tools.transcribe_audio(audio_path)
+            with tracing.span("transcribe", audio_s=round(audio_clip.duration, 2)):
+                transcript = stt_tts_tools.transcribe_audio(audio_clip)
         except Exception as e:
             print(f"Transcription error: {e}")
             transcript = ""
 
-        if not transcript:
-            stt_tts_tools.speak_text("I didn't quite catch that. Could you try saying it again?")
-            continue
+    if not transcript:
+        stt_tts_tools.speak_text(NO_TRANSCRIPT_MESSAGE)
+        return True
 
-        print(f"You: {transcript}")
+    print(f"You: {transcript}")
+    with tracing.span("guardian"):
         safety_alert = guardian_check(transcript)
-        if safety_alert:
-            print(safety_alert)
-            stt_tts_tools.speak_text(safety_alert)
-            break
+    if safety_alert:
+        print(safety_alert)
+        stt_tts_tools.speak_text(safety_alert)
+        return False
 
-        recent_history = memory_tools.get_recent_history(days=7)
-        user_profile = memory_tools.get_user_profile()
-        prompt = get_companion_prompt(transcript, recent_history, user_profile)
+    with tracing.span("context"):
+        system_instruction, prompt = get_companion_request(transcript)
+        config = get_companion_config(system_instruction)
+    companion_response = None
+    if STREAM_REPLIES:
+        # Generation and sentence-by-sentence TTS overlap, so they share one span
+        with tracing.span("generate_and_speak", streamed=True):
+            companion_response = speak_streaming_reply(prompt, config)
+    if not companion_response:
         try:
-            response = client.models.generate_content(
-                model='gemini-2.5-flash',
-                contents=prompt
-            )
+            with tracing.span("generate"):
+                response = client.models.generate_content(
+                    model=COMPANION_MODEL,
+                    contents=prompt,
+                    config=config
+                )
             companion_response = response.text
         except Exception as e:
             companion_response = f"Oops, I had a little trouble. Tell me more. (Error: {e})"
 
         print(f"SerenAI: {companion_response}")
-        stt_tts_tools.speak_text(companion_response)
-        analyze_and_log_session(transcript, audio_path)
+        with tracing.span("tts"):
+            stt_tts_tools.speak_text_bytes(companion_response, cache=False)
+    # Analysis (biomarkers, scoring, profile update) runs off the critical path
+    analysis_queue.submit(transcript, audio_clip, session_id=session_id)
 
-        # After the agent speaks, the user can reply — loop will record the next full input.
-        if "goodbye" in transcript.lower() or "that's all for today" in transcript.lower():
-            stt_tts_tools.speak_text("Got it. Thanks for checking in today. I'm here tomorrow if you need me!")
-            break
-        print("When you're ready to reply, speak and press Enter when finished...")
+    # After the agent speaks, the user can reply — loop will record the next full input.
+    if "goodbye" in transcript.lower() or "that's all for today" in transcript.lower():
+        stt_tts_tools.speak_text(GOODBYE_MESSAGE)
+        return False
+    return True
 
 if __name__ == '__main__':
     print("Run the full application via main.py")
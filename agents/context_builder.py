@@ -0,0 +1,181 @@
+# agents/context_builder.py
+"""
+Token-budgeted context for companion prompts.
+
+get_companion_prompt used to inline every log row from the last week and every
+profile trait, so prompts grew with how long someone had used the app. The
+builder here keeps the context inside CONTEXT_TOKEN_BUDGET: the most salient
+recent check-ins are quoted, older days are collapsed into one line each from
+daily_rollups, and only the most recently updated profile traits are kept.
+"""
+import datetime
+import functools
+import math
+import os
+
+from tools import memory_tools
+
+# Rough budget for history + profile; the preamble and the user's turn come on top
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "800"))
+# Share of the budget the profile may use; whatever it leaves goes to history
+PROFILE_BUDGET_SHARE = float(os.getenv("PROFILE_BUDGET_SHARE", "0.35"))
+PROFILE_MAX_TRAITS = int(os.getenv("PROFILE_MAX_TRAITS", "12"))
+HISTORY_DAYS = int(os.getenv("HISTORY_DAYS", "7"))
+# Check-ins newer than this are quoted individually; older days become summaries
+HISTORY_DETAIL_DAYS = int(os.getenv("HISTORY_DETAIL_DAYS", "2"))
+HISTORY_MAX_ROWS = int(os.getenv("HISTORY_MAX_ROWS", "40"))
+SUMMARY_BUDGET_SHARE = 0.4
+MAX_ENTRY_CHARS = 240
+RECENCY_HALF_LIFE_HOURS = 24.0
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+@functools.lru_cache(maxsize=8)
+def get_companion_preamble(language: str = "en") -> str:
+    """The static part of every companion prompt; built once per language."""
+    return (
+        f"Language: {language}\n"
+        "You are SerenAI, the user's empathetic best friend and daily wellness companion.\n"
+        "Behavior Constraints:\n"
+        "1. Tone: Be warm, casual, and supportive.\n"
+        "2. Length: Keep responses concise (2-4 sentences max).\n"
+        "3. Goal: Always end with an open-ended follow-up question.\n"
+    )
+
+
+def _truncate(text, limit=MAX_ENTRY_CHARS):
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def _parse_timestamp(value):
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def salience(row, now=None) -> float:
+    """
+    Score a daily_logs row (the get_recent_history shape) for inclusion.
+    Newer check-ins score higher, as do ones with elevated risk, anxiety or an
+    unusually high or low mood.
+    """
+    now = now or datetime.datetime.now()
+    ts = _parse_timestamp(row[1])
+    age_hours = max(0.0, (now - ts).total_seconds() / 3600) if ts else HISTORY_DAYS * 24
+    score = math.pow(0.5, age_hours / RECENCY_HALF_LIFE_HOURS)
+    mood, anxiety, risk = row[4], row[5], row[6]
+    if mood:
+        score += abs(mood - 5.5) / 9
+    if anxiety:
+        score += max(anxiety - 5, 0) / 10
+    if risk:
+        score += 0.5 * risk
+    return score
+
+
+def _history_line(row):
+    return f"- {str(row[1])[:16].replace('T', ' ')}: {_truncate(row[3])}"
+
+
+def _rollup_line(rollup):
+    parts = [f"{rollup['entries']} check-in{'s' if rollup['entries'] != 1 else ''}"]
+    if rollup['mood_avg'] is not None:
+        parts.append(f"mood avg {rollup['mood_avg']:.1f}")
+    if rollup['anxiety_avg'] is not None:
+        parts.append(f"anxiety avg {rollup['anxiety_avg']:.1f}")
+    if rollup['risk_max']:
+        parts.append(f"max risk {rollup['risk_max']}")
+    return f"- {rollup['day']} (summary): " + ", ".join(parts)
+
+
+def format_history(rows, rollups=(), token_budget=CONTEXT_TOKEN_BUDGET, detail_days=HISTORY_DETAIL_DAYS, now=None) -> str:
+    """
+    Render history within `token_budget`. Rows from the last `detail_days` are
+    picked by salience and listed newest first; days before that come from
+    `rollups` (get_daily_rollups dicts) as one summary line per day.
+    """
+    now = now or datetime.datetime.now()
+    detail_since = (now - datetime.timedelta(days=detail_days)).date().isoformat()
+    detailed = [r for r in rows if str(r[1])[:10] >= detail_since]
+    summarized = [r for r in rollups if r['day'] < detail_since]
+    if not rows and not rollups:
+        return ""
+
+    if not rollups:
+        # Caller passed raw rows only: collapse the older ones per day here
+        by_day = {}
+        for r in rows:
+            if str(r[1])[:10] < detail_since:
+                by_day.setdefault(str(r[1])[:10], []).append(r)
+        summarized = []
+        for day in by_day:
+            moods = [r[4] for r in by_day[day] if r[4]]
+            anxieties = [r[5] for r in by_day[day] if r[5]]
+            summarized.append({
+                'day': day,
+                'entries': len(by_day[day]),
+                'mood_avg': sum(moods) / len(moods) if moods else None,
+                'anxiety_avg': sum(anxieties) / len(anxieties) if anxieties else None,
+                'risk_max': max((r[6] or 0) for r in by_day[day]),
+            })
+    summary_lines = [_rollup_line(r) for r in sorted(summarized, key=lambda r: r['day'], reverse=True)]
+    # Keep room for the day summaries so busy recent days can't crowd out the week
+    reserved = min(sum(estimate_tokens(l) + 1 for l in summary_lines), int(token_budget * SUMMARY_BUDGET_SHARE))
+
+    chosen, used = [], 0
+    for row in sorted(detailed, key=lambda r: salience(r, now), reverse=True):
+        cost = estimate_tokens(_history_line(row)) + 1
+        if used + cost > token_budget - reserved:
+            continue
+        chosen.append(row)
+        used += cost
+    lines = [_history_line(r) for r in sorted(chosen, key=lambda r: str(r[1]), reverse=True)]
+    for line in summary_lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            break
+        lines.append(line)
+        used += cost
+    return "\n".join(lines)
+
+
+def format_profile(traits, token_budget=CONTEXT_TOKEN_BUDGET, max_traits=PROFILE_MAX_TRAITS) -> str:
+    """
+    Render profile traits within `token_budget`. `traits` is either the
+    get_profile_traits rows (newest first) or a plain {key: value} dict.
+    """
+    if isinstance(traits, dict):
+        traits = [(k, v, None) for k, v in traits.items()]
+    lines, used = [], 0
+    for key, value, _updated in traits[:max_traits]:
+        line = f"- {key}: {_truncate(value, 160)}"
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            continue
+        lines.append(line)
+        used += cost
+    return "\n".join(lines)
+
+
+def build_companion_context(user_id: str = memory_tools.DEFAULT_USER_ID, token_budget: int = CONTEXT_TOKEN_BUDGET):
+    """
+    Fetch and render the history and profile blocks for `user_id`. Reads are
+    bounded (HISTORY_MAX_ROWS rows, one rollup row per day, PROFILE_MAX_TRAITS
+    traits), so the cost stays flat however long the user has used the app.
+    Returns (history_str, profile_str).
+    """
+    traits = memory_tools.get_profile_traits(user_id, limit=PROFILE_MAX_TRAITS)
+    profile_str = format_profile(traits, int(token_budget * PROFILE_BUDGET_SHARE))
+    history_budget = token_budget - estimate_tokens(profile_str)
+    rows = memory_tools.get_recent_history(HISTORY_DETAIL_DAYS + 1, user_id, limit=HISTORY_MAX_ROWS)
+    rollups = memory_tools.get_daily_rollups(HISTORY_DAYS, user_id)
+    history_str = format_history(rows, rollups, history_budget)
+    return history_str, profile_str
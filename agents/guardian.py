@@ -8,49 +8,48 @@ IMMEDIATE_RISK_KEYWORDS = [
 MAX_DAYS_IN_LOW_MOOD = 3
 MAX_AVG_ANXIETY_SCORE = 7.0
 
+# Compile the matcher at import; later calls only rebuild it if the keyword file changes
+crisis_tools.get_crisis_matcher(IMMEDIATE_RISK_KEYWORDS)
+
+def get_crisis_message() -> str:
+    return (
+        "IMMEDIATE DANGER ALERT:\n"
+        "I am an AI and your safety is my top priority. Based on what you said, please reach out to a human professional right now.\n"
+        f"HELPLINE: {crisis_tools.get_crisis_helpline()}\n"
+        "Please talk to them immediately."
+    )
+
 def check_immediate_risk(transcript: str) -> str | None:
-    transcript_lower = transcript.lower()
-    for keyword in IMMEDIATE_RISK_KEYWORDS:
-        if keyword in transcript_lower:
-            crisis_msg = (
-                "IMMEDIATE DANGER ALERT:\n"
-                "I am an AI and your safety is my top priority. Based on what you said, please reach out to a human professional right now.\n"
-                f"HELPLINE: {crisis_tools.get_crisis_helpline()}\n"
-                "Please talk to them immediately."
-            )
-            return crisis_msg
+    matcher = crisis_tools.get_crisis_matcher(IMMEDIATE_RISK_KEYWORDS)
+    if matcher.search(transcript):
+        return get_crisis_message()
     return None
 
-def check_long_term_trend_risk() -> str | None:
-    logs = memory_tools.get_recent_history(days=7)
-    if not logs:
+def check_long_term_trend_risk(user_id=memory_tools.DEFAULT_USER_ID) -> str | None:
+    # Served from the aggregates save_daily_log maintains; no history rescan per turn
+    trend = memory_tools.get_trend_snapshot(days=7, user_id=user_id)
+    if not trend['entries']:
         return None
-    low_mood_days = 0
-    total_anxiety = 0.0
-    for log in logs:
-        if log[4] < 4:
-            low_mood_days += 1
-        else:
-            low_mood_days = 0
-        total_anxiety += log[5]
-    if low_mood_days >= MAX_DAYS_IN_LOW_MOOD:
+    if trend['low_mood_streak'] >= MAX_DAYS_IN_LOW_MOOD:
         return (
             "INTERVENTION SUGGESTION:\n"
             "Mood has been low for several consecutive days. Consider scheduling a professional check-in or exploring coping resources."
         )
-    avg_anxiety = total_anxiety / len(logs)
-    if avg_anxiety >= MAX_AVG_ANXIETY_SCORE and len(logs) >= 5:
+    if not trend['anxiety_count']:
+        return None
+    avg_anxiety = trend['anxiety_sum'] / trend['anxiety_count']
+    if avg_anxiety >= MAX_AVG_ANXIETY_SCORE and trend['entries'] >= 5:
         return (
             "ANXIETY CHECK:\n"
             "Anxiety and vocal tremor metrics have been elevated this past week. Consider focusing the next session on relaxation techniques."
         )
     return None
 
-def guardian_check(transcript: str) -> str | None:
+def guardian_check(transcript: str, user_id=memory_tools.DEFAULT_USER_ID) -> str | None:
     crisis_alert = check_immediate_risk(transcript)
     if crisis_alert:
         return crisis_alert
-    trend_alert = check_long_term_trend_risk()
+    trend_alert = check_long_term_trend_risk(user_id)
     if trend_alert:
         return trend_alert
     return None
@@ -0,0 +1,188 @@
+import asyncio
+import datetime
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from tools import stt_tts_tools, memory_tools, tracing
+from tools.stt_service import get_stt_service
+from tools.audio_clip import AudioClip
+from tools.artifact_store import ARTIFACT_RETAIN_AUDIO, get_artifact_store
+from tools.genai_client import deadline
+from agents.guardian import guardian_check
+from agents.analyst import get_analysis_queue
+from agents.companion import get_companion_request, get_companion_config, COMPANION_MODEL
+
+STT_WORKERS = int(os.getenv("STT_WORKERS", "2"))
+MAX_CONCURRENT_LLM_CALLS = int(os.getenv("MAX_CONCURRENT_LLM_CALLS", "16"))
+SESSION_IDLE_TIMEOUT = float(os.getenv("SESSION_IDLE_TIMEOUT", "1800"))
+# Upper bound on the Gemini part of a turn, retries and rate-limit waits included
+REPLY_DEADLINE_SECONDS = float(os.getenv("REPLY_DEADLINE_SECONDS", "20"))
+
+
+class SessionState:
+    """Per-conversation state. Turns within one session run one at a time."""
+
+    def __init__(self, user_id: str, session_id: str = None):
+        self.session_id = session_id or str(uuid.uuid4())
+        self.user_id = user_id
+        self.created_at = datetime.datetime.now()
+        self.last_active = self.created_at
+        self.messages = []
+        self.ended = False
+        self.lock = asyncio.Lock()
+
+    def to_dict(self) -> dict:
+        return {
+            "session_id": self.session_id,
+            "user_id": self.user_id,
+            "created_at": self.created_at.isoformat(timespec="seconds"),
+            "turns": sum(1 for m in self.messages if m["role"] == "user"),
+            "ended": self.ended,
+        }
+
+
+class SessionEngine:
+    """
+    The companion/guardian/analyst pipeline as an asyncio service, so one
+    process can hold many check-ins at once.
+
+    Gemini calls use the client's async API and overlap freely (bounded by
+    MAX_CONCURRENT_LLM_CALLS); Whisper runs on the batching STT process pool
+    (tools/stt_service.py) when STT_SERVICE_WORKERS > 0, otherwise on a shared
+    in-process STT thread pool; SQLite,
+    guardian and TTS work goes to the default executor. Every read and write is
+    scoped to the session's user_id, and post-reply analysis goes through the
+    shared background AnalysisQueue.
+    """
+
+    def __init__(self, client, stt_workers: int = STT_WORKERS, max_concurrent_llm: int = MAX_CONCURRENT_LLM_CALLS):
+        self.client = client
+        self.sessions = {}
+        self.stt_service = get_stt_service()
+        self._stt_pool = ThreadPoolExecutor(max_workers=stt_workers, thread_name_prefix="stt")
+        self._llm_slots = asyncio.Semaphore(max_concurrent_llm)
+        self.analysis_queue = get_analysis_queue()
+
+    async def start(self):
+        await asyncio.to_thread(memory_tools.setup_database)
+        if self.stt_service is None:
+            loop = asyncio.get_running_loop()
+            # Load and warm the shared Whisper model before the first session arrives
+            await loop.run_in_executor(self._stt_pool, stt_tts_tools.initialize_stt_model)
+
+    async def close(self):
+        self.sessions.clear()
+        await asyncio.to_thread(self.analysis_queue.shutdown, True)
+        self._stt_pool.shutdown(wait=True)
+        if self.stt_service is not None:
+            await asyncio.to_thread(self.stt_service.shutdown)
+
+    # --- sessions ---
+
+    def open_session(self, user_id: str = memory_tools.DEFAULT_USER_ID) -> SessionState:
+        session = SessionState(user_id or memory_tools.DEFAULT_USER_ID)
+        self.sessions[session.session_id] = session
+        return session
+
+    def get_session(self, session_id: str) -> SessionState:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def close_session(self, session_id: str) -> bool:
+        get_artifact_store().close_session(session_id)
+        return self.sessions.pop(session_id, None) is not None
+
+    def expire_idle_sessions(self, idle_seconds: float = SESSION_IDLE_TIMEOUT) -> int:
+        cutoff = datetime.datetime.now() - datetime.timedelta(seconds=idle_seconds)
+        expired = [sid for sid, s in self.sessions.items() if s.last_active < cutoff and not s.lock.locked()]
+        for sid in expired:
+            del self.sessions[sid]
+            get_artifact_store().close_session(sid)
+        return len(expired)
+
+    # --- pipeline stages ---
+
+    async def transcribe(self, audio: AudioClip) -> str:
+        if self.stt_service is not None:
+            return await asyncio.wrap_future(self.stt_service.submit(audio))
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._stt_pool, stt_tts_tools.transcribe_audio, audio)
+
+    async def generate_reply(self, prompt: str, config: dict = None) -> str:
+        async with self._llm_slots:
+            response = await self.client.aio.models.generate_content(model=COMPANION_MODEL, contents=prompt, config=config)
+        return response.text
+
+    async def handle_turn(self, session_id: str, text: str = None, audio: AudioClip = None, speak: bool = True) -> dict:
+        """
+        Run one user turn. Pass either `text` or an `audio` clip. Returns a dict
+        with transcript, reply, alert, end_session and (if speak) the TTS audio.
+        """
+        session = self.get_session(session_id)
+        async with session.lock:
+            with tracing.span("turn", session_id=session.session_id, user_id=session.user_id):
+                return await self._handle_turn(session, text, audio, speak)
+
+    async def _handle_turn(self, session: SessionState, text: str, audio: AudioClip, speak: bool) -> dict:
+        session.last_active = datetime.datetime.now()
+        result = {"session_id": session.session_id, "transcript": text or "", "reply": None,
+                  "alert": None, "end_session": False}
+        if session.ended:
+            raise RuntimeError("Session has ended")
+
+        transcript = text
+        if transcript is None and audio is not None:
+            with tracing.span("transcribe", audio_s=round(audio.duration, 2)):
+                transcript = await self.transcribe(audio)
+        transcript = (transcript or "").strip()
+        result["transcript"] = transcript
+        if not transcript:
+            result["reply"] = "I didn't quite catch that. Could you try saying it again?"
+            return await self._finish(result, speak)
+
+        session.messages.append({"role": "user", "text": transcript})
+        with tracing.span("guardian"):
+            alert = await asyncio.to_thread(guardian_check, transcript, session.user_id)
+        if alert:
+            session.ended = True
+            result.update(alert=alert, reply=alert, end_session=True)
+            return await self._finish(result, speak)
+
+        with tracing.span("context"):
+            system_instruction, prompt = await asyncio.to_thread(get_companion_request, transcript, user_id=session.user_id)
+        try:
+            with deadline(REPLY_DEADLINE_SECONDS), tracing.span("generate"):
+                config = get_companion_config(system_instruction)
+                reply = await self.generate_reply(prompt, config)
+        except Exception as e:
+            reply = f"Oops, I had a little trouble. Tell me more. (Error: {e})"
+        result["reply"] = reply
+        session.messages.append({"role": "assistant", "text": reply})
+
+        # submit() can block briefly when the queue is full; keep that off the event loop
+        await asyncio.to_thread(self._submit_analysis, session, transcript, audio)
+        return await self._finish(result, speak)
+
+    def _submit_analysis(self, session: SessionState, transcript: str, audio: AudioClip):
+        store = get_artifact_store()
+        if audio is not None and ARTIFACT_RETAIN_AUDIO:
+            store.save_clip(audio, session.session_id)
+        try:
+            self.analysis_queue.submit(transcript, audio, user_id=session.user_id, session_id=session.session_id)
+        finally:
+            # The queue holds its own reference until the analysis is done
+            store.release(audio)
+
+    async def _finish(self, result: dict, speak: bool) -> dict:
+        if speak and result.get("reply"):
+            try:
+                with tracing.span("tts"):
+                    audio_bytes, mime = await asyncio.to_thread(stt_tts_tools.speak_text_bytes, result["reply"], cache=False)
+                result["audio"], result["audio_mime"] = audio_bytes, mime
+            except Exception as e:
+                print(f"TTS error: {e}")
+        return result
+
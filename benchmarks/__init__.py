@@ -0,0 +1,13 @@
+"""
+Offline benchmark suite.
+
+    python -m benchmarks.run                      # everything that can run here
+    python -m benchmarks.run --only memory,turns --turns 200
+    python -m benchmarks.run --compare benchmarks/results/<old>.json
+
+Gemini and TTS are replaced by deterministic fakes with injected latency
+(benchmarks/fakes.py) and the audio comes from a synthetic, seeded corpus
+(benchmarks/corpus.py), so runs need no network, API key or microphone and
+are comparable across commits. Components whose dependencies are missing
+(Whisper, openSMILE) are reported as skipped rather than failing the run.
+"""
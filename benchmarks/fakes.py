@@ -0,0 +1,77 @@
+# benchmarks/fakes.py
+"""
+Deterministic stand-ins for the network services, with injected latency.
+
+install_fakes() points every GenAI user (the shared client, the companion and
+the analyst) at a ResilientClient wrapping tools.genai_stub.StubClient, so the
+retry / rate-limit wrapper is still on the measured path, and makes a
+FakeTTSBackend the active TTS engine. State that would leak into the real app
+(SQLite database, TTS cache, trace export) is redirected into `workdir`.
+"""
+import io
+import itertools
+import os
+import time
+import wave
+from pathlib import Path
+
+from tools import genai_client, memory_tools, stt_tts_tools, tracing, tts_backends
+from tools.genai_stub import DEFAULT_REPLY, StubClient
+
+
+class FakeTTSBackend(tts_backends.TTSBackend):
+    """Sleeps `latency` plus `per_char_latency` per character, then returns a
+    silent WAV roughly as long as the text would take to say."""
+
+    name = "fake"
+    audio_format = "wav"
+    latency = 0.0
+    per_char_latency = 0.0
+
+    def synthesize(self, text: str, lang: str = "en") -> bytes:
+        time.sleep(self.latency + self.per_char_latency * len(text))
+        seconds = max(0.2, len(text) / 15.0)  # ~15 characters per second of speech
+        buf = io.BytesIO()
+        with wave.open(buf, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(16000)
+            w.writeframes(b"\x00\x00" * int(seconds * 16000))
+        return buf.getvalue()
+
+
+def numbered_reply():
+    """Reply function whose every answer is distinct, so each turn pays for TTS
+    instead of hitting the content-addressed cache."""
+    counter = itertools.count(1)
+    return lambda model, prompt, config: f"{DEFAULT_REPLY} (#{next(counter)})"
+
+
+def install_fakes(workdir: str, llm_latency: float = 0.35, token_latency: float = 0.01,
+                  tts_latency: float = 0.25, tts_per_char_latency: float = 0.0):
+    """Install the fakes process-wide and return the ResilientClient."""
+    stub = StubClient(reply=numbered_reply(), latency=llm_latency, token_latency=token_latency)
+    client = genai_client.ResilientClient(raw=stub, rate_limits={})
+    genai_client._client = client
+
+    from agents import analyst, companion
+
+    # Modules imported earlier captured whatever client existed then
+    analyst.client = client
+    companion.client = client
+    # No client-side throttling: the fake has no quota, and waiting on the
+    # token bucket would measure the configured RPM instead of the code
+    for model in (companion.COMPANION_MODEL, analyst.ANALYST_MODEL, analyst.PROFILE_MODEL):
+        client.rate_limits[model] = 1_000_000
+
+    FakeTTSBackend.latency = tts_latency
+    FakeTTSBackend.per_char_latency = tts_per_char_latency
+    tts_backends.TTS_BACKENDS[FakeTTSBackend.name] = FakeTTSBackend
+    tts_backends.TTS_BACKEND = FakeTTSBackend.name
+    tts_backends.TTS_FALLBACK_BACKEND = ""
+
+    os.makedirs(workdir, exist_ok=True)
+    memory_tools.DB_PATH = os.path.join(workdir, "user_history.db")
+    stt_tts_tools.TTS_CACHE_DIR = Path(workdir) / "tts_cache"
+    tracing.tracer.export_path = None
+    return client
@@ -0,0 +1,379 @@
+# benchmarks/run.py
+"""
+Run the offline benchmarks and write a JSON report.
+
+Each benchmark returns {metric: stats} where stats has count, mean/p50/p95/p99/
+min/max seconds and throughput_per_s, or {"skipped": reason} when a
+dependency is missing. The report records the git commit, so reports from two
+commits can be diffed with --compare.
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import importlib.util
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.corpus import CORPUS_DURATIONS, CORPUS_SEED, build_corpus
+from benchmarks.fakes import install_fakes
+
+BENCHMARKS = ("memory", "guardian", "stt", "biomarkers", "turns")
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+BENCH_USER_ID = "bench"
+
+NEUTRAL_TRANSCRIPTS = [
+    "I had a pretty normal day at work, a few meetings and then I went for a walk.",
+    "Honestly I'm a bit tired, I didn't sleep well because the neighbours were loud.",
+    "My sister called and we talked for an hour about our parents' anniversary plans.",
+    "I keep worrying about the presentation on Friday even though I've prepared a lot.",
+    "Today was good. I cooked dinner for the first time in weeks and it felt nice.",
+    "I felt anxious on the train this morning but it passed after a few minutes.",
+    "Not much to report, I mostly stayed in and read a book.",
+    "Work was stressful and my manager changed the deadline again without telling anyone.",
+]
+CRISIS_TRANSCRIPTS = [
+    "Some days I feel like it's not worth living anymore.",
+    "I've been thinking about how I might harm myself.",
+]
+
+
+def summarize(samples, wall: float = None) -> dict:
+    """Latency stats for a list of per-call durations (seconds). `wall` is the
+    elapsed time the calls took together; it defaults to their sum."""
+    if not samples:
+        return {"count": 0}
+    values = np.asarray(samples, dtype=np.float64)
+    wall = wall if wall is not None else float(values.sum())
+    return {
+        "count": len(values),
+        "mean_s": float(values.mean()),
+        "p50_s": float(np.percentile(values, 50)),
+        "p95_s": float(np.percentile(values, 95)),
+        "p99_s": float(np.percentile(values, 99)),
+        "min_s": float(values.min()),
+        "max_s": float(values.max()),
+        "throughput_per_s": len(values) / wall if wall > 0 else None,
+    }
+
+
+def timed_calls(fn, args_list):
+    """Call fn(*args) for each args tuple; return (durations, results)."""
+    durations, results = [], []
+    for args in args_list:
+        start = time.perf_counter()
+        results.append(fn(*args))
+        durations.append(time.perf_counter() - start)
+    return durations, results
+
+
+def _missing(module):
+    return importlib.util.find_spec(module) is None
+
+
+# ----------------------------------------------------------------
+# BENCHMARKS
+# ----------------------------------------------------------------
+def bench_memory(opts, clips):
+    from agents.context_builder import build_companion_context
+    from tools import memory_tools
+
+    results = {}
+    durations, _ = timed_calls(memory_tools.setup_database, [()])
+    results["setup_database"] = summarize(durations)
+
+    # History spread over the last 30 days, oldest first, as a long-time user would have
+    rng = np.random.default_rng(opts.seed)
+    now = datetime.datetime.now()
+    logs = []
+    for i in range(opts.history_rows):
+        when = now - datetime.timedelta(days=30 * (1 - i / opts.history_rows))
+        logs.append(({
+            "timestamp": when.isoformat(timespec="seconds"),
+            "session_id": f"bench-{i}",
+            "user_id": BENCH_USER_ID,
+            "transcript_summary": NEUTRAL_TRANSCRIPTS[i % len(NEUTRAL_TRANSCRIPTS)],
+            "mood_score": int(rng.integers(3, 10)),
+            "anxiety_score": int(rng.integers(1, 9)),
+            "risk_level": 0,
+            "jitter_score": float(rng.uniform(0.01, 0.05)),
+            "loudness_mean": float(rng.uniform(0.2, 0.8)),
+        },))
+    durations, _ = timed_calls(memory_tools.save_daily_log, logs)
+    results["save_daily_log"] = summarize(durations)
+
+    traits = [(f"trait_{i}", f"value {i}", BENCH_USER_ID) for i in range(20)]
+    durations, _ = timed_calls(memory_tools.update_user_profile, traits)
+    results["update_user_profile"] = summarize(durations)
+
+    reads = {
+        "get_recent_history": lambda: memory_tools.get_recent_history(7, BENCH_USER_ID),
+        "get_trend_snapshot": lambda: memory_tools.get_trend_snapshot(7, BENCH_USER_ID),
+        "get_daily_rollups": lambda: memory_tools.get_daily_rollups(30, BENCH_USER_ID),
+        "get_user_profile": lambda: memory_tools.get_user_profile(BENCH_USER_ID),
+        "build_companion_context": lambda: build_companion_context(BENCH_USER_ID),
+    }
+    for name, read in reads.items():
+        durations, _ = timed_calls(read, [()] * opts.repeat)
+        results[name] = summarize(durations)
+    return results
+
+
+def bench_guardian(opts, clips):
+    from agents.guardian import check_immediate_risk, guardian_check
+    from tools import memory_tools
+
+    memory_tools.setup_database()
+    # Roughly one crisis utterance in ten, interleaved deterministically
+    transcripts = [
+        CRISIS_TRANSCRIPTS[i // 10 % len(CRISIS_TRANSCRIPTS)] if i % 10 == 9
+        else NEUTRAL_TRANSCRIPTS[i % len(NEUTRAL_TRANSCRIPTS)]
+        for i in range(opts.repeat)
+    ]
+    durations, alerts = timed_calls(check_immediate_risk, [(t,) for t in transcripts])
+    results = {"check_immediate_risk": summarize(durations)}
+    results["check_immediate_risk"]["alerts"] = sum(1 for a in alerts if a)
+    durations, _ = timed_calls(guardian_check, [(t, BENCH_USER_ID) for t in transcripts])
+    results["guardian_check"] = summarize(durations)
+    return results
+
+
+def bench_stt(opts, clips):
+    if _missing("whisper"):
+        return {"skipped": "openai-whisper is not installed"}
+    from tools import stt_tts_tools
+
+    results = {}
+    durations, _ = timed_calls(stt_tts_tools.initialize_stt_model, [(opts.stt_model,)])
+    results["model_load_and_warmup"] = summarize(durations)
+    all_durations, audio_seconds = [], 0.0
+    for clip in clips:
+        durations, _ = timed_calls(stt_tts_tools.transcribe_audio, [(clip, opts.stt_model)] * opts.stt_repeat)
+        stats = summarize(durations)
+        stats["audio_s"] = clip.duration
+        stats["real_time_factor"] = stats["p50_s"] / clip.duration
+        results[f"transcribe_{clip.duration:g}s"] = stats
+        all_durations += durations
+        audio_seconds += clip.duration * opts.stt_repeat
+    total = summarize(all_durations)
+    total["audio_seconds_per_s"] = audio_seconds / sum(all_durations)
+    results["transcribe_all"] = total
+    return results
+
+
+def bench_biomarkers(opts, clips):
+    if _missing("opensmile"):
+        return {"skipped": "opensmile is not installed"}
+    from tools import audio_tools
+
+    results = {}
+    durations, _ = timed_calls(audio_tools.get_biomarker_extractor, [()])
+    results["extractor_init"] = summarize(durations)
+    for clip in clips:
+        durations, _ = timed_calls(audio_tools.extract_vocal_biomarkers, [(clip,)] * opts.repeat_audio)
+        stats = summarize(durations)
+        stats["audio_s"] = clip.duration
+        results[f"extract_clip_{clip.duration:g}s"] = stats
+        if clip.path:
+            durations, _ = timed_calls(audio_tools.extract_vocal_biomarkers, [(clip.path,)] * opts.repeat_audio)
+            results[f"extract_file_{clip.duration:g}s"] = summarize(durations)
+    batch = list(clips) * opts.repeat_audio
+    for processes in sorted({1, opts.processes}):
+        start = time.perf_counter()
+        audio_tools.extract_vocal_biomarkers_batch(batch, processes=processes)
+        wall = time.perf_counter() - start
+        results[f"batch_{processes}proc"] = {"count": len(batch), "wall_s": wall,
+                                            "throughput_per_s": len(batch) / wall}
+    return results
+
+
+async def _simulate_sessions(engine, opts, clips):
+    async def one_session(index):
+        session = engine.open_session(f"turn-user-{index % opts.users}")
+        durations = []
+        for turn in range(opts.turns):
+            if clips is not None:
+                kwargs = {"audio": clips[(index + turn) % len(clips)]}
+            else:
+                kwargs = {"text": NEUTRAL_TRANSCRIPTS[(index + turn) % len(NEUTRAL_TRANSCRIPTS)]}
+            start = time.perf_counter()
+            await engine.handle_turn(session.session_id, speak=True, **kwargs)
+            durations.append(time.perf_counter() - start)
+        return durations
+
+    start = time.perf_counter()
+    per_session = await asyncio.gather(*(one_session(i) for i in range(opts.sessions)))
+    wall = time.perf_counter() - start
+    return [d for durations in per_session for d in durations], wall
+
+
+def bench_turns(opts, clips, client):
+    from agents.session_engine import SessionEngine
+    from tools import memory_tools, tracing
+
+    audio_turns = not _missing("whisper")
+
+    async def run():
+        engine = SessionEngine(client)
+        if audio_turns:
+            await engine.start()
+        else:
+            await asyncio.to_thread(memory_tools.setup_database)
+        results = {}
+        tracing.tracer.reset()
+        durations, wall = await _simulate_sessions(engine, opts, None)
+        results["text_turn"] = summarize(durations, wall)
+        if audio_turns:
+            tracing.tracer.reset()
+            durations, wall = await _simulate_sessions(engine, opts, clips)
+            results["audio_turn"] = summarize(durations, wall)
+        # Post-reply analysis runs behind the replies; include the time to drain it
+        start = time.perf_counter()
+        await engine.close()
+        results["analysis_drain"] = {"wall_s": time.perf_counter() - start}
+        results["stages"] = tracing.latency_summary()
+        return results
+
+    results = asyncio.run(run())
+    if not audio_turns:
+        results["audio_turn"] = {"skipped": "openai-whisper is not installed"}
+    results["genai_client"] = client.metrics()
+    return results
+
+
+# ----------------------------------------------------------------
+# REPORTING
+# ----------------------------------------------------------------
+def git_commit():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def print_report(report):
+    print(f"{'benchmark':<44} {'count':>6} {'p50 (ms)':>10} {'p95 (ms)':>10} {'per s':>10}")
+    for bench, metrics in report["results"].items():
+        if "skipped" in metrics:
+            print(f"{bench:<44} skipped: {metrics['skipped']}")
+            continue
+        for name, stats in metrics.items():
+            if not isinstance(stats, dict) or "p50_s" not in stats:
+                continue
+            rate = stats.get("throughput_per_s")
+            print(f"{bench + '.' + name:<44} {stats['count']:>6} {stats['p50_s'] * 1000:>10.2f} "
+                  f"{stats['p95_s'] * 1000:>10.2f} {rate if rate is None else round(rate, 1):>10}")
+
+
+def compare_reports(baseline, current):
+    """Print the p50/p95 change for every metric present in both reports."""
+    old_commit = (baseline["meta"].get("git_commit") or "?")[:10]
+    new_commit = (current["meta"].get("git_commit") or "?")[:10]
+    print(f"\n{'benchmark':<44} {'p50 ' + old_commit:>16} {'p50 ' + new_commit:>16} {'p50 Δ':>8} {'p95 Δ':>8}")
+    for bench, metrics in current["results"].items():
+        old_metrics = baseline["results"].get(bench, {})
+        for name, stats in metrics.items():
+            old = old_metrics.get(name)
+            if not isinstance(stats, dict) or not isinstance(old, dict) or "p50_s" not in stats or "p50_s" not in old:
+                continue
+            p50 = (stats["p50_s"] / old["p50_s"] - 1) * 100 if old["p50_s"] else 0.0
+            p95 = (stats["p95_s"] / old["p95_s"] - 1) * 100 if old["p95_s"] else 0.0
+            print(f"{bench + '.' + name:<44} {old['p50_s'] * 1000:>13.2f} ms {stats['p50_s'] * 1000:>13.2f} ms "
+                  f"{p50:>+7.1f}% {p95:>+7.1f}%")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="SerenAI offline benchmarks")
+    parser.add_argument("--only", default=",".join(BENCHMARKS),
+                        help=f"comma-separated subset of {', '.join(BENCHMARKS)}")
+    parser.add_argument("--out", default=None, help="report path (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument("--compare", default=None, help="baseline report to diff against")
+    parser.add_argument("--workdir", default=None, help="scratch directory (default: a temporary one)")
+    parser.add_argument("--seed", type=int, default=CORPUS_SEED)
+    parser.add_argument("--durations", default=",".join(f"{d:g}" for d in CORPUS_DURATIONS),
+                        help="corpus clip lengths in seconds")
+    parser.add_argument("--repeat", type=int, default=200, help="iterations for the fast (DB, guardian) paths")
+    parser.add_argument("--repeat-audio", type=int, default=3, help="iterations per clip for biomarkers")
+    parser.add_argument("--stt-repeat", type=int, default=2, help="iterations per clip for STT")
+    parser.add_argument("--stt-model", default=None, help="Whisper model size (default: STT_MODEL_SIZE)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="workers for batch biomarkers")
+    parser.add_argument("--history-rows", type=int, default=500, help="daily_logs rows to seed")
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent simulated sessions")
+    parser.add_argument("--turns", type=int, default=5, help="turns per simulated session")
+    parser.add_argument("--users", type=int, default=4, help="distinct users across the sessions")
+    parser.add_argument("--llm-latency", type=float, default=0.35, help="fake Gemini latency per call (s)")
+    parser.add_argument("--token-latency", type=float, default=0.01, help="fake delay between streamed words (s)")
+    parser.add_argument("--tts-latency", type=float, default=0.25, help="fake TTS latency per call (s)")
+    parser.add_argument("--verbose", action="store_true", help="show the app's own log output")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    opts = parse_args(argv)
+    selected = [b.strip() for b in opts.only.split(",") if b.strip()]
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        raise SystemExit(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    with contextlib.ExitStack() as stack:
+        workdir = opts.workdir or stack.enter_context(tempfile.TemporaryDirectory(prefix="serenai-bench-"))
+        client = install_fakes(workdir, opts.llm_latency, opts.token_latency, opts.tts_latency)
+        durations = [float(d) for d in opts.durations.split(",") if d.strip()]
+        clips = build_corpus(os.path.join(workdir, "corpus"), durations, seed=opts.seed)
+
+        results = {}
+        for name in selected:
+            print(f"Running {name}...", flush=True)
+            quiet = contextlib.nullcontext() if opts.verbose else contextlib.redirect_stdout(io.StringIO())
+            start = time.perf_counter()
+            with quiet:
+                if name == "turns":
+                    results[name] = bench_turns(opts, clips, client)
+                else:
+                    results[name] = globals()[f"bench_{name}"](opts, clips)
+            print(f"  done in {time.perf_counter() - start:.1f}s")
+
+    commit, dirty = git_commit()
+    report = {
+        "meta": {
+            "git_commit": commit,
+            "git_dirty": dirty,
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "config": {k: v for k, v in vars(opts).items() if k not in {"out", "compare", "workdir", "verbose"}},
+        "results": results,
+    }
+    out = opts.out or os.path.join(
+        RESULTS_DIR, f"{(commit or 'nogit')[:10]}-{datetime.datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print()
+    print_report(report)
+    print(f"\nReport written to {out}")
+    if opts.compare:
+        with open(opts.compare, encoding="utf-8") as f:
+            compare_reports(json.load(f), report)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,43 @@
 # Load environment variables before importing modules that initialize API clients
 from dotenv import load_dotenv
+import argparse
 import os
 load_dotenv()
 
-from agents.companion import run_session_loop
-from tools.memory_tools import setup_database
+def parse_args():
+    parser = argparse.ArgumentParser(description="SerenAI daily check-in companion")
+    parser.add_argument("--serve", action="store_true",
+                        help="run the multi-user session server instead of the local CLI session")
+    parser.add_argument("--host", default=None, help="server bind address (with --serve)")
+    parser.add_argument("--port", type=int, default=None, help="server port (with --serve)")
+    parser.add_argument("--profile-startup", action="store_true",
+                        help="report per-module import time for the chosen mode and exit")
+    return parser.parse_args()
 
 if __name__ == '__main__':
-    # Ensure the database structure is created before starting
-    setup_database() 
-    
-    # Start the conversation
-    run_session_loop()
\ No newline at end of file
+    args = parse_args()
+
+    if args.profile_startup:
+        from tools.startup import print_import_profile
+
+        print_import_profile(["session_server"] if args.serve else ["agents.companion"])
+        print("\nDeferred until first use / background prewarm:")
+        for module in ["google.genai", "whisper", "opensmile", "sounddevice"]:
+            try:
+                print_import_profile([module], top=5)
+            except RuntimeError as e:
+                print(f"{module}: not importable ({e})")
+        raise SystemExit(0)
+
+    if args.serve:
+        import session_server
+        session_server.serve(args.host or session_server.SERVER_HOST, args.port or session_server.SERVER_PORT)
+    else:
+        from agents.companion import run_session_loop
+        from tools.memory_tools import setup_database
+
+        # Ensure the database structure is created before starting
+        setup_database()
+
+        # Start the conversation
+        run_session_loop()
@@ -0,0 +1,187 @@
+# session_server.py
+"""
+Multi-user SerenAI session server.
+
+HTTP API (JSON):
+  POST   /sessions                 {"user_id": "..."}                 -> session info
+  POST   /sessions/{id}/turns      {"text": "..."} or {"audio_b64": "<WAV bytes, base64>"}
+  GET    /sessions/{id}                                               -> session info
+  DELETE /sessions/{id}
+  GET    /sessions/{id}/ws         WebSocket; send the same JSON as /turns, receive turn results
+  GET    /health
+  GET    /metrics/latency                                             -> per-stage p50/p95/p99
+
+Run with:  python main.py --serve [--host 127.0.0.1] [--port 8765]
+"""
+import asyncio
+import base64
+import binascii
+import os
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from aiohttp import web, WSMsgType
+
+from agents.session_engine import SessionEngine
+from tools import tracing
+from tools.artifact_store import get_artifact_store
+from tools.audio_clip import AudioClip
+
+SERVER_HOST = os.getenv("SERENAI_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERENAI_PORT", "8765"))
+
+ENGINE_KEY = web.AppKey("engine", SessionEngine)
+
+
+def _turn_payload(result: dict) -> dict:
+    payload = {k: v for k, v in result.items() if k != "audio"}
+    if result.get("audio"):
+        payload["audio_b64"] = base64.b64encode(result["audio"]).decode("ascii")
+    return payload
+
+
+async def _json_body(request) -> dict:
+    """The request's JSON object body ({} when there is none); 400 on anything else."""
+    if not request.can_read_body:
+        return {}
+    try:
+        body = await request.json()
+    except ValueError as e:
+        raise web.HTTPBadRequest(text=f"Invalid JSON body: {e}")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="JSON body must be an object")
+    return body
+
+
+def _parse_turn(body: dict):
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="Turn must be a JSON object")
+    text = body.get("text")
+    if text is not None and not isinstance(text, str):
+        raise web.HTTPBadRequest(text="'text' must be a string")
+    audio = None
+    if body.get("audio_b64"):
+        try:
+            audio = AudioClip.from_wav_bytes(base64.b64decode(body["audio_b64"]))
+        except (binascii.Error, ValueError, TypeError) as e:
+            raise web.HTTPBadRequest(text=f"Invalid audio_b64: {e}")
+    if text is None and audio is None:
+        raise web.HTTPBadRequest(text="Send 'text' or 'audio_b64'")
+    return text, audio, bool(body.get("speak", True))
+
+
+def _session_or_404(engine: SessionEngine, session_id: str):
+    try:
+        return engine.get_session(session_id)
+    except KeyError:
+        raise web.HTTPNotFound(text="Unknown session")
+
+
+async def create_session(request):
+    body = await _json_body(request)
+    user_id = body.get("user_id")
+    if user_id is not None and not isinstance(user_id, str):
+        raise web.HTTPBadRequest(text="'user_id' must be a string")
+    session = request.app[ENGINE_KEY].open_session(user_id)
+    return web.json_response(session.to_dict(), status=201)
+
+
+async def get_session(request):
+    session = _session_or_404(request.app[ENGINE_KEY], request.match_info["session_id"])
+    return web.json_response(session.to_dict())
+
+
+async def delete_session(request):
+    if not request.app[ENGINE_KEY].close_session(request.match_info["session_id"]):
+        raise web.HTTPNotFound(text="Unknown session")
+    return web.json_response({"closed": True})
+
+
+async def post_turn(request):
+    engine = request.app[ENGINE_KEY]
+    session = _session_or_404(engine, request.match_info["session_id"])
+    text, audio, speak = _parse_turn(await _json_body(request))
+    try:
+        result = await engine.handle_turn(session.session_id, text=text, audio=audio, speak=speak)
+    except RuntimeError as e:
+        raise web.HTTPConflict(text=str(e))
+    return web.json_response(_turn_payload(result))
+
+
+async def session_ws(request):
+    engine = request.app[ENGINE_KEY]
+    session = _session_or_404(engine, request.match_info["session_id"])
+    ws = web.WebSocketResponse(heartbeat=30)
+    await ws.prepare(request)
+    async for msg in ws:
+        if msg.type != WSMsgType.TEXT:
+            continue
+        try:
+            text, audio, speak = _parse_turn(msg.json())
+            result = await engine.handle_turn(session.session_id, text=text, audio=audio, speak=speak)
+            await ws.send_json(_turn_payload(result))
+            if result.get("end_session"):
+                break
+        except (web.HTTPException, RuntimeError, ValueError) as e:
+            await ws.send_json({"error": getattr(e, "text", None) or str(e)})
+    await ws.close()
+    return ws
+
+
+async def health(request):
+    engine = request.app[ENGINE_KEY]
+    return web.json_response({
+        "status": "ok",
+        "sessions": len(engine.sessions),
+        "pending_analysis": engine.analysis_queue.pending(),
+        "stt": engine.stt_service.metrics() if engine.stt_service is not None else None,
+        "genai": engine.client.metrics() if hasattr(engine.client, "metrics") else None,
+        "artifacts": get_artifact_store().stats(),
+    })
+
+
+async def latency(request):
+    """Per-stage latency histograms (count, mean, p50/p95/p99 in seconds)."""
+    return web.json_response(tracing.latency_summary())
+
+
+async def _expire_idle_sessions(app):
+    while True:
+        await asyncio.sleep(60)
+        app[ENGINE_KEY].expire_idle_sessions()
+
+
+async def _engine_lifecycle(app):
+    from agents.companion import client
+
+    engine = SessionEngine(client)
+    await engine.start()
+    app[ENGINE_KEY] = engine
+    reaper = asyncio.create_task(_expire_idle_sessions(app))
+    yield
+    reaper.cancel()
+    await engine.close()
+
+
+def create_app() -> web.Application:
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.cleanup_ctx.append(_engine_lifecycle)
+    app.add_routes([
+        web.get("/health", health),
+        web.get("/metrics/latency", latency),
+        web.post("/sessions", create_session),
+        web.get("/sessions/{session_id}", get_session),
+        web.delete("/sessions/{session_id}", delete_session),
+        web.post("/sessions/{session_id}/turns", post_turn),
+        web.get("/sessions/{session_id}/ws", session_ws),
+    ])
+    return app
+
+
+def serve(host: str = SERVER_HOST, port: int = SERVER_PORT):
+    web.run_app(create_app(), host=host, port=port)
+
+
+if __name__ == '__main__':
+    serve()
@@ -3,13 +3,13 @@ import warnings
 # Silence the mic-recorder ScriptRunContext warning early (if it appears)
 warnings.filterwarnings("ignore", message="missing ScriptRunContext")
 
-from pathlib import Path
 import streamlit as st
 GOOGLE_API_KEY = st.secrets["GOOGLE_API_KEY"]
 
 import os
 import base64
 import datetime
+import uuid
 import streamlit as st
 
 # Try to import the mic recorder component; allow a graceful fallback if it's missing.
@@ -20,35 +20,82 @@ except Exception:
     MIC_AVAILABLE = False
 
 # Local project imports
-from agents.companion import get_companion_prompt
-from tools import stt_tts_tools, memory_tools
+from agents.companion import get_companion_request, get_companion_config, COMPANION_MODEL, STREAM_REPLIES
+from agents import context_builder
+from tools import stt_tts_tools, memory_tools, startup, tracing
+from tools.audio_clip import AudioClip
+from tools.genai_client import get_genai_client
 
-# GenAI client (explicit api_key is more reliable inside Streamlit)
-try:
-    from google import genai
-    client = genai.Client(api_key=GOOGLE_API_KEY)
-except Exception:
-    client = None
+# History/profile reads are reused for this long unless a write happens first
+READ_CACHE_TTL_SECONDS = int(os.getenv("STREAMLIT_READ_CACHE_TTL", "60"))
 
-# Ensure required dirs & DB
-Path("data/temp_audio").mkdir(parents=True, exist_ok=True)
-try:
-    memory_tools.setup_database()
-except Exception:
-    pass
+# --- Process-wide resources: built on the first run, shared by every rerun and session ---
+
+@st.cache_resource(show_spinner=False)
+def get_client():
+    # GenAI client (explicit api_key is more reliable inside Streamlit)
+    return get_genai_client(api_key=GOOGLE_API_KEY)
+
+@st.cache_resource(show_spinner=False)
+def get_db_pool():
+    # Ensure the DB exists
+    try:
+        memory_tools.setup_database()
+    except Exception:
+        pass
+    return memory_tools.get_pool()
+
+@st.cache_resource(show_spinner="Loading speech model...")
+def load_stt_model():
+    return stt_tts_tools.initialize_stt_model()
+
+# --- Cached reads: keyed on the DB write version, so any write invalidates them ---
+
+@st.cache_data(ttl=READ_CACHE_TTL_SECONDS, show_spinner=False)
+def cached_recent_history(days: int, write_version: int):
+    return memory_tools.get_recent_history(days=days)
+
+@st.cache_data(ttl=READ_CACHE_TTL_SECONDS, show_spinner=False)
+def cached_companion_context(write_version: int):
+    return context_builder.build_companion_context()
 
 # Streamlit page config
 st.set_page_config(page_title="SerenAI", layout="wide")
 
+client = get_client()
+get_db_pool()
+
+# Load Whisper and google.genai in the background; runs once per server process
+startup.prewarm(biomarkers=False)
+
 # --- Session state defaults ---
 if "messages" not in st.session_state:
     # messages: list[{"role":"user"|"assistant", "text": str, "ts": iso-str}]
     st.session_state["messages"] = []
 if "processing" not in st.session_state:
     st.session_state["processing"] = False
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = str(uuid.uuid4())
 
 # --- Helpers ---
 
+def turn_span():
+    """Root span for one user turn, tagged with this browser session's id."""
+    return tracing.span("turn", session_id=st.session_state["session_id"])
+
+def render_latency_panel():
+    """Per-stage latency table (seconds) from the in-process tracer."""
+    summary = tracing.latency_summary()
+    if not summary:
+        st.caption("No turns traced yet.")
+        return
+    rows = [
+        {"stage": name, "count": stats["count"],
+         "p50": round(stats["p50_s"], 3), "p95": round(stats["p95_s"], 3), "p99": round(stats["p99_s"], 3)}
+        for name, stats in sorted(summary.items(), key=lambda item: -item[1]["p50_s"])
+    ]
+    st.dataframe(rows, hide_index=True, use_container_width=True)
+
 def _now_ts():
     return datetime.datetime.now().isoformat(timespec="seconds")
 
@@ -71,72 +118,56 @@ def extract_response_text(response) -> str:
         except Exception:
             return str(response)
 
-def generate_reply_from_model(user_text: str) -> str:
-    """Build prompt and call model; returns the assistant text."""
-    try:
-        recent_history = memory_tools.get_recent_history(days=7)
-    except Exception:
-        recent_history = None
-    try:
-        user_profile = memory_tools.get_user_profile()
-    except Exception:
-        user_profile = None
-
+def build_request(user_text: str):
+    """Per-turn prompt plus a config carrying the companion instruction."""
     try:
-        prompt = get_companion_prompt(user_text, recent_history, user_profile)
+        with tracing.span("context"):
+            context = cached_companion_context(memory_tools.get_write_version())
+            system_instruction, prompt = get_companion_request(user_text, context=context)
     except Exception:
-        prompt = f"User said: {user_text}"
+        return f"User said: {user_text}", None
+    return prompt, get_companion_config(system_instruction)
 
+def generate_reply_from_model(user_text: str) -> str:
+    """Build prompt and call model; returns the assistant text."""
     if client is None:
         return "GenAI client not initialized. Check environment/config."
 
+    prompt, config = build_request(user_text)
     try:
-        response = client.models.generate_content(model="gemini-2.5-flash", contents=prompt)
+        response = client.models.generate_content(model=COMPANION_MODEL, contents=prompt, config=config)
         return extract_response_text(response)
     except Exception as e:
         return f"Model generation error: {e}"
 
-def safe_write_bytes_to_file(path: str, b: bytes) -> None:
-    """Write raw bytes to disk (ensures parent exists)."""
-    p = Path(path)
-    p.parent.mkdir(parents=True, exist_ok=True)
-    with open(p, "wb") as f:
-        f.write(b)
-
-def resolve_tts_path_from_speak(reply_text: str) -> str | None:
-    """
-    Call the project's speak_text helper and return the resulting file path.
-    If speak_text returns None or raises, fall back to the default mp3 path.
-    """
-    # Call the project's speak function if available
+def stream_reply_from_model(user_text: str):
+    """Like generate_reply_from_model, but yields text fragments as Gemini streams them."""
+    prompt, config = build_request(user_text)
+    for chunk in client.models.generate_content_stream(model=COMPANION_MODEL, contents=prompt, config=config):
+        text = getattr(chunk, "text", None)
+        if text:
+            yield text
+
+def respond_streaming(user_text: str) -> str:
+    """Show and voice the reply sentence by sentence as it streams in.
+    Returns the full reply, or "" if nothing could be streamed."""
+    placeholder = st.empty()
+    spoken = []
     try:
-        out = stt_tts_tools.speak_text(reply_text)
-        # If the function returns a Path-like or str, use it if file exists later
-        if out:
-            return str(out)
-    except Exception:
-        # ignore and fallback
-        pass
-    # fallback default location many versions of the repo use
-    fallback = "data/temp_audio/ai_response.mp3"
-    return fallback
-
-def play_tts_file(tts_path: str):
-    """Read audio bytes and play in Streamlit using correct mime type."""
-    p = Path(tts_path)
-    if not p.exists() or p.stat().st_size == 0:
-        st.warning("TTS audio file missing or empty; could not play audio.")
-        return
-    ext = p.suffix.lower()
-    with open(p, "rb") as f:
-        audio_bytes = f.read()
-    if ext == ".wav":
-        st.audio(audio_bytes, format="audio/wav")
-    elif ext == ".mp3":
-        st.audio(audio_bytes, format="audio/mp3")
-    else:
-        # try generic playback; browsers usually accept wav/mp3
-        st.audio(audio_bytes)
+        sentences = stt_tts_tools.iter_sentences(stream_reply_from_model(user_text))
+        for sentence, audio_bytes, mime in stt_tts_tools.speak_text_stream(sentences):
+            spoken.append(sentence)
+            placeholder.markdown(f"**SerenAI:**  \n{' '.join(spoken)}")
+            try:
+                st.audio(audio_bytes, format=mime)
+            except Exception as e:
+                st.warning(f"TTS playback failed: {e}")
+    except Exception as e:
+        if not spoken:
+            placeholder.empty()
+            return ""
+        st.warning(f"Reply stream interrupted: {e}")
+    return " ".join(spoken)
 
 def process_user_message_and_respond(user_text: str):
     """Append user -> call model -> append assistant -> call TTS/playback (best-effort)."""
@@ -144,16 +175,26 @@ def process_user_message_and_respond(user_text: str):
     ts = _now_ts()
     st.session_state["messages"].append({"role": "user", "text": user_text, "ts": ts})
 
+    # Streamed reply: first sentence is voiced while the rest is still generating
+    reply = ""
+    if client is not None and STREAM_REPLIES:
+        with tracing.span("generate_and_speak", streamed=True):
+            reply = respond_streaming(user_text)
+    if reply:
+        st.session_state["messages"].append({"role": "assistant", "text": reply, "ts": _now_ts()})
+        st.session_state["processing"] = False
+        return
+
     # Model reply
-    reply = generate_reply_from_model(user_text)
+    with tracing.span("generate"):
+        reply = generate_reply_from_model(user_text)
     st.session_state["messages"].append({"role": "assistant", "text": reply, "ts": _now_ts()})
 
-    # TTS: call speak_text and play bytes (minimal-fix-A: read bytes)
-    tts_path = resolve_tts_path_from_speak(reply)
+    # TTS: synthesize with the configured backend and play the bytes directly
     try:
-        # If speak_text wrote to a bytes buffer rather than returning path, handle that in tool
-        # But most implementations write a file; fallback handled in play_tts_file
-        play_tts_file(tts_path)
+        with tracing.span("tts"):
+            audio_bytes, mime = stt_tts_tools.speak_text_bytes(reply, cache=False)
+        st.audio(audio_bytes, format=mime)
     except Exception as e:
         st.warning(f"TTS playback failed: {e}")
 
@@ -196,41 +237,40 @@ with col_left:
         audio = None
         st.warning("Microphone recorder component not available. Install `streamlit-mic-recorder` to enable in-browser recording.")
 
-    # Process recorded audio (if any)
+    # Process recorded audio (if any) — kept in memory, never written to disk
     if audio:
-        tmp_path = "data/temp_audio/mic_input.wav"
+        clip = None
         try:
             # audio["bytes"] might be raw bytes or base64-encoded string depending on component version
             b = audio.get("bytes")
             if isinstance(b, str):
                 # base64 string
                 b = base64.b64decode(b)
-            safe_write_bytes_to_file(tmp_path, b)
+            clip = AudioClip.from_wav_bytes(b)
         except Exception as e:
-            st.error(f"Failed saving recorded audio: {e}")
-            tmp_path = None
+            st.error(f"Failed reading recorded audio: {e}")
 
-        if tmp_path and Path(tmp_path).exists():
-            st.audio(tmp_path, format="audio/wav")
-            # Transcribe
-            try:
-                # initialize only if function exists; some implementations don't require init
-                if hasattr(stt_tts_tools, "initialize_stt_model"):
+        if clip is not None and len(clip):
+            st.audio(b, format="audio/wav")
+            with turn_span():
+                # Transcribe
+                try:
                     try:
-                        stt_tts_tools.initialize_stt_model()
+                        load_stt_model()
                     except Exception:
                         # ignore initialization errors; transcription may still work
                         pass
-                transcript = stt_tts_tools.transcribe_audio(tmp_path)
-            except Exception as e:
-                st.error(f"Transcription error: {e}")
-                transcript = ""
-
-            if transcript:
-                st.success("Transcribed: " + transcript)
-                process_user_message_and_respond(transcript)
-            else:
-                st.warning("No transcript returned. Try again or type a message below.")
+                    with tracing.span("transcribe", audio_s=round(clip.duration, 2)):
+                        transcript = stt_tts_tools.transcribe_audio(clip)
+                except Exception as e:
+                    st.error(f"Transcription error: {e}")
+                    transcript = ""
+
+                if transcript:
+                    st.success("Transcribed: " + transcript)
+                    process_user_message_and_respond(transcript)
+                else:
+                    st.warning("No transcript returned. Try again or type a message below.")
 
     # Text input form (clear_on_submit avoids manual session_state edits)
     st.subheader("Or type your message")
@@ -243,7 +283,8 @@ with col_left:
             if not text_to_send:
                 st.error("Type a message first.")
             else:
-                process_user_message_and_respond(text_to_send)
+                with turn_span():
+                    process_user_message_and_respond(text_to_send)
                 # form will clear automatically due to clear_on_submit=True
 
     # show processing status
@@ -263,7 +304,7 @@ with col_right:
 
     if st.button("Show recent history (7 days)"):
         try:
-            history = memory_tools.get_recent_history(days=7) or []
+            history = cached_recent_history(7, memory_tools.get_write_version()) or []
         except Exception:
             history = []
         if not history:
@@ -277,3 +318,7 @@ with col_right:
                 if summary:
                     st.write(f"  • {summary}")
 
+with st.sidebar:
+    if st.checkbox("Show latency panel", value=False):
+        st.subheader("Turn latency")
+        render_latency_panel()
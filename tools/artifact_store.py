@@ -0,0 +1,287 @@
+# tools/artifact_store.py
+"""
+Lifecycle of the audio files SerenAI writes to disk.
+
+Recordings normally stay in memory (AudioClip). When one does have to be
+written - persist=True, or ARTIFACT_RETAIN_AUDIO=1 to keep recordings for
+later review - it goes through the ArtifactStore:
+
+- every file gets its own path, ARTIFACT_DIR/<session_id>/turn-<n>-<kind>.wav,
+  so concurrent sessions never share a filename;
+- files are reference-counted. The code that saved a file holds one
+  reference, and the analysis queue takes another until it has finished with
+  the audio. When the last reference is released the file is deleted, or,
+  when retaining, optionally compressed to FLAC/Opus (ARTIFACT_COMPRESSION)
+  and kept;
+- total size is capped at ARTIFACT_QUOTA_MB. Retained files are evicted
+  oldest first, and files still in use are never evicted.
+"""
+import os
+import re
+import shutil
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "data/artifacts")
+ARTIFACT_QUOTA_BYTES = int(float(os.getenv("ARTIFACT_QUOTA_MB", "500")) * 1024 * 1024)
+ARTIFACT_RETAIN_AUDIO = os.getenv("ARTIFACT_RETAIN_AUDIO", "0").strip().lower() in {"1", "true", "yes"}
+# "" keeps WAV; "flac" (lossless) or "opus" (much smaller) for retained recordings
+ARTIFACT_COMPRESSION = os.getenv("ARTIFACT_COMPRESSION", "").strip().lower()
+ARTIFACT_OPUS_BITRATE = os.getenv("ARTIFACT_OPUS_BITRATE", "24k")
+# Unreferenced files this old are left over from an earlier process
+ARTIFACT_ORPHAN_SECONDS = int(os.getenv("ARTIFACT_ORPHAN_SECONDS", "3600"))
+
+_COMPRESSION_FORMATS = {"flac", "opus"}
+
+
+def _path_of(artifact):
+    """Path string for an AudioClip (its .path) or a path-like; None if there is none."""
+    path = getattr(artifact, "path", artifact)
+    return os.path.abspath(path) if path else None
+
+
+def _session_dir(session_id):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", session_id or "default")
+
+
+def compress_audio(path, fmt: str, bitrate: str = ARTIFACT_OPUS_BITRATE) -> Path:
+    """
+    Re-encode the WAV at `path` as FLAC or Opus next to it and delete the
+    original. Uses pydub when installed, otherwise the ffmpeg binary. Returns
+    the new path, or `path` unchanged if encoding isn't possible.
+    """
+    path = Path(path)
+    target = path.with_suffix(f".{fmt}")
+    try:
+        try:
+            from pydub import AudioSegment
+
+            AudioSegment.from_wav(str(path)).export(
+                str(target), format=fmt, bitrate=bitrate if fmt == "opus" else None
+            )
+        except ImportError:
+            ffmpeg = shutil.which("ffmpeg")
+            if ffmpeg is None:
+                raise RuntimeError("neither pydub nor ffmpeg is available")
+            codec = ["-c:a", "flac"] if fmt == "flac" else ["-c:a", "libopus", "-b:a", bitrate]
+            subprocess.run(
+                [ffmpeg, "-nostdin", "-loglevel", "error", "-y", "-i", str(path), *codec, str(target)],
+                check=True, capture_output=True, timeout=60,
+            )
+    except Exception as e:
+        print(f"Could not compress {path} to {fmt}, keeping WAV: {e}")
+        target.unlink(missing_ok=True)
+        return path
+    path.unlink(missing_ok=True)
+    return target
+
+
+class ArtifactStore:
+    """Allocates, reference-counts and evicts per-session audio files under `root`."""
+
+    def __init__(self, root=ARTIFACT_DIR, quota_bytes=ARTIFACT_QUOTA_BYTES, retain=ARTIFACT_RETAIN_AUDIO,
+                 compression=ARTIFACT_COMPRESSION):
+        if compression and compression not in _COMPRESSION_FORMATS:
+            raise ValueError(f"Unknown ARTIFACT_COMPRESSION {compression!r}; choose from {sorted(_COMPRESSION_FORMATS)}")
+        self.root = Path(root)
+        self.quota_bytes = quota_bytes
+        self.retain = retain
+        self.compression = compression
+        self._refs = {}   # absolute path -> reference count
+        self._turns = {}  # session_id -> last turn number handed out
+        self._bytes = None  # running total, scanned on first use
+        self._lock = threading.RLock()
+
+    # --- allocation ---
+
+    def allocate(self, session_id: str, kind: str = "user", ext: str = "wav") -> Path:
+        """A fresh path for the next turn of `session_id` (directories created)."""
+        name = _session_dir(session_id)
+        with self._lock:
+            turn = self._turns.get(name, 0) + 1
+            self._turns[name] = turn
+        directory = self.root / name
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"turn-{turn:04d}-{kind}.{ext}"
+        while path.exists():  # a previous process used this session id
+            turn += 1
+            path = directory / f"turn-{turn:04d}-{kind}.{ext}"
+        with self._lock:
+            self._turns[name] = max(turn, self._turns[name])
+        return path
+
+    def save_clip(self, clip, session_id: str, kind: str = "user") -> str:
+        """Write `clip` to a new per-turn WAV and hold one reference to it for
+        the caller, who must release() it when done."""
+        path = clip.save(str(self.allocate(session_id, kind)))
+        self.register(path)
+        return path
+
+    def register(self, path) -> None:
+        """Start tracking a file written elsewhere, with one reference held."""
+        key = _path_of(path)
+        size = os.path.getsize(key)
+        with self._lock:
+            self._refs[key] = self._refs.get(key, 0) + 1
+            self._account(size)
+        self.enforce_quota()
+
+    # --- reference counting ---
+
+    def acquire(self, artifact) -> bool:
+        """Take another reference to a stored file (AudioClip or path). Returns
+        False if the store doesn't manage it (e.g. an in-memory clip)."""
+        key = _path_of(artifact)
+        with self._lock:
+            if key not in self._refs:
+                return False
+            self._refs[key] += 1
+            return True
+
+    def release(self, artifact) -> None:
+        """Drop a reference. The last one deletes the file, or compresses and
+        retains it when the store keeps audio."""
+        key = _path_of(artifact)
+        with self._lock:
+            if key not in self._refs:
+                return
+            self._refs[key] -= 1
+            if self._refs[key] > 0:
+                return
+            del self._refs[key]
+        self._finalize(Path(key))
+
+    def in_use(self, artifact) -> bool:
+        with self._lock:
+            return _path_of(artifact) in self._refs
+
+    def _finalize(self, path: Path):
+        try:
+            size = path.stat().st_size
+        except OSError:
+            return
+        if not self.retain:
+            self._remove(path, size)
+            return
+        if self.compression:
+            compressed = compress_audio(path, self.compression)
+            if compressed != path:
+                try:
+                    new_size = compressed.stat().st_size
+                except OSError:
+                    new_size = 0
+                with self._lock:
+                    self._account(new_size - size)
+        self.enforce_quota()
+
+    # --- disk quota ---
+
+    def _scan(self):
+        entries = []
+        if self.root.exists():
+            for path in self.root.glob("*/*"):
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _account(self, delta: int):
+        # Caller holds the lock
+        if self._bytes is None:
+            self._bytes = sum(size for _, size, _ in self._scan())
+        else:
+            self._bytes += delta
+
+    def usage_bytes(self) -> int:
+        with self._lock:
+            self._account(0)
+            return self._bytes
+
+    def enforce_quota(self) -> int:
+        """Evict unreferenced files, oldest first, until the store is back under
+        90% of its quota. Returns the number of files removed."""
+        with self._lock:
+            self._account(0)
+            if self._bytes <= self.quota_bytes:
+                return 0
+            entries = sorted(self._scan())
+            total = sum(size for _, size, _ in entries)
+            target = int(self.quota_bytes * 0.9)
+            evicted = 0
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                if os.path.abspath(path) in self._refs:
+                    continue  # still being transcribed or analysed
+                try:
+                    path.unlink()
+                except OSError:
+                    continue
+                total -= size
+                evicted += 1
+                self._remove_empty_dir(path.parent)
+            self._bytes = total
+        if evicted:
+            print(f"Artifact store over quota; evicted {evicted} old recording(s).")
+        return evicted
+
+    def purge_orphans(self, older_than: float = ARTIFACT_ORPHAN_SECONDS) -> int:
+        """Delete unreferenced files left by an earlier process (kept when
+        retaining audio; the quota governs those)."""
+        if self.retain:
+            return 0
+        cutoff = time.time() - older_than
+        removed = 0
+        for mtime, size, path in self._scan():
+            if mtime < cutoff and not self.in_use(path):
+                self._remove(path, size)
+                removed += 1
+        return removed
+
+    def _remove(self, path: Path, size: int):
+        try:
+            path.unlink()
+        except OSError:
+            return
+        with self._lock:
+            self._account(-size)
+        self._remove_empty_dir(path.parent)
+
+    def _remove_empty_dir(self, directory: Path):
+        if directory != self.root:
+            try:
+                directory.rmdir()  # only succeeds when empty
+            except OSError:
+                pass
+
+    # --- sessions ---
+
+    def close_session(self, session_id: str) -> None:
+        """Forget the session's turn counter; its files follow their references."""
+        name = _session_dir(session_id)
+        with self._lock:
+            self._turns.pop(name, None)
+        self._remove_empty_dir(self.root / name)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"bytes": self.usage_bytes(), "quota_bytes": self.quota_bytes,
+                    "in_use": len(self._refs), "retain": self.retain, "compression": self.compression or None}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    """The process-wide ArtifactStore (cleans up orphans on first use)."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ArtifactStore()
+            _store.purge_orphans()
+        return _store
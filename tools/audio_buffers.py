@@ -0,0 +1,149 @@
+import threading
+
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-capacity float32 ring buffer for mono audio.
+    Single producer (the sounddevice callback) and single consumer. Writes never
+    block: when the consumer falls behind, the oldest unread samples are dropped
+    and counted in `overruns`.
+    """
+
+    def __init__(self, capacity: int):
+        self._buf = np.zeros(int(capacity), dtype=np.float32)
+        self._capacity = int(capacity)
+        self._written = 0  # total samples ever written
+        self._read = 0     # total samples ever read
+        self._closed = False
+        self._cond = threading.Condition()
+        self.overruns = 0
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def available(self) -> int:
+        with self._cond:
+            return self._written - self._read
+
+    def write(self, samples) -> None:
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        n = len(samples)
+        if n == 0:
+            return
+        with self._cond:
+            if n > self._capacity:
+                self.overruns += n - self._capacity
+                samples = samples[-self._capacity:]
+                n = self._capacity
+            free = self._capacity - (self._written - self._read)
+            if n > free:
+                self.overruns += n - free
+                self._read += n - free
+            start = self._written % self._capacity
+            first = min(n, self._capacity - start)
+            self._buf[start:start + first] = samples[:first]
+            if first < n:
+                self._buf[:n - first] = samples[first:]
+            self._written += n
+            self._cond.notify_all()
+
+    def read(self, max_samples: int = None, timeout: float = None) -> np.ndarray:
+        """Return up to max_samples unread samples (a copy), waiting up to timeout for data."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._written > self._read or self._closed, timeout)
+            n = self._written - self._read
+            if max_samples is not None:
+                n = min(n, max_samples)
+            if n <= 0:
+                return np.zeros(0, dtype=np.float32)
+            start = self._read % self._capacity
+            first = min(n, self._capacity - start)
+            out = np.empty(n, dtype=np.float32)
+            out[:first] = self._buf[start:start + first]
+            if first < n:
+                out[first:] = self._buf[:n - first]
+            self._read += n
+            return out
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class CaptureBuffer:
+    """
+    Growable float32 arena for one recording. The sounddevice callback writes
+    each block straight into preallocated memory (no per-block arrays to
+    collect and concatenate); view() exposes the captured samples without
+    copying. Capacity doubles when full, up to max_samples, after which
+    further samples are dropped and counted in `dropped`.
+    Single producer; read the view once the stream has stopped.
+    """
+
+    def __init__(self, initial_samples: int, max_samples: int = None):
+        self.max_samples = int(max_samples) if max_samples else None
+        initial = int(initial_samples)
+        if self.max_samples:
+            initial = min(initial, self.max_samples)
+        self._buf = np.empty(max(1, initial), dtype=np.float32)
+        self._size = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def capacity(self) -> int:
+        return len(self._buf)
+
+    def _grow(self, needed: int):
+        capacity = max(needed, 2 * len(self._buf))
+        if self.max_samples:
+            capacity = min(capacity, self.max_samples)
+        if capacity > len(self._buf):
+            grown = np.empty(capacity, dtype=np.float32)
+            grown[:self._size] = self._buf[:self._size]
+            self._buf = grown
+
+    def write(self, block) -> None:
+        """Append a (frames,) or (frames, channels) block; only channel 0 is kept."""
+        if block.ndim > 1:
+            block = block[:, 0]
+        n = len(block)
+        end = self._size + n
+        if end > len(self._buf):
+            self._grow(end)
+            if end > len(self._buf):
+                self.dropped += end - len(self._buf)
+                n = len(self._buf) - self._size
+                end = len(self._buf)
+        self._buf[self._size:end] = block[:n]
+        self._size = end
+
+    def view(self) -> np.ndarray:
+        """The captured samples, sharing the buffer's memory (treat as read-only)."""
+        return self._buf[:self._size]
+
+
+def float_to_int16(samples: np.ndarray, out: np.ndarray = None, block: int = 65536) -> np.ndarray:
+    """
+    Clip float samples to [-1, 1] and scale to int16 into `out` (allocated if
+    None), a block at a time through one small scratch array, so no
+    full-length float temporaries are created and `samples` is left untouched.
+    """
+    samples = np.asarray(samples).reshape(-1)
+    if out is None:
+        out = np.empty(len(samples), dtype=np.int16)
+    scale = np.float32(np.iinfo(np.int16).max)
+    scratch = np.empty(min(block, len(samples)), dtype=np.float32)
+    for start in range(0, len(samples), block):
+        chunk = samples[start:start + block]
+        tmp = scratch[:len(chunk)]
+        np.clip(chunk, -1.0, 1.0, out=tmp)
+        np.multiply(tmp, scale, out=tmp)
+        out[start:start + len(chunk)] = tmp  # truncates toward zero, like astype
+    return out
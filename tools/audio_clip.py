@@ -0,0 +1,85 @@
+import io
+import os
+
+import numpy as np
+
+from tools.audio_buffers import float_to_int16
+
+
+class AudioClip:
+    """
+    Mono float32 audio kept in memory, so a recording can go from the recorder
+    to Whisper and openSMILE without WAV encode/decode passes.
+
+    `samples` wraps the caller's buffer without copying whenever it is already
+    mono float32; consumers share it and must treat it as read-only. A file is
+    only written when save() is called, and `path` then points at it.
+    """
+
+    __slots__ = ("samples", "sample_rate", "path")
+
+    def __init__(self, samples, sample_rate: int, path: str = None):
+        samples = np.asarray(samples)
+        if samples.ndim > 1:
+            samples = samples[:, 0] if samples.shape[1] == 1 else samples.mean(axis=1)
+        if np.issubdtype(samples.dtype, np.integer):
+            samples = samples.astype(np.float32) / np.iinfo(samples.dtype).max
+        elif samples.dtype != np.float32:
+            samples = samples.astype(np.float32)
+        self.samples = samples
+        self.sample_rate = int(sample_rate)
+        self.path = path
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __repr__(self):
+        return f"AudioClip({self.duration:.2f}s @ {self.sample_rate} Hz, path={self.path!r})"
+
+    @property
+    def duration(self) -> float:
+        return len(self.samples) / self.sample_rate if self.sample_rate else 0.0
+
+    @classmethod
+    def from_wav_bytes(cls, data: bytes):
+        from scipy.io import wavfile
+
+        sample_rate, samples = wavfile.read(io.BytesIO(data))
+        return cls(samples, sample_rate)
+
+    @classmethod
+    def from_file(cls, path: str):
+        from scipy.io import wavfile
+
+        sample_rate, samples = wavfile.read(path)
+        return cls(samples, sample_rate, path=str(path))
+
+    def resampled(self, target_rate: int):
+        """Return this clip at target_rate (self if it already matches)."""
+        if target_rate == self.sample_rate:
+            return self
+        from math import gcd
+        from scipy.signal import resample_poly
+
+        g = gcd(self.sample_rate, target_rate)
+        samples = resample_poly(self.samples, target_rate // g, self.sample_rate // g)
+        return AudioClip(samples.astype(np.float32, copy=False), target_rate)
+
+    def to_int16(self) -> np.ndarray:
+        return float_to_int16(self.samples)
+
+    def to_wav_bytes(self) -> bytes:
+        from scipy.io import wavfile
+
+        buf = io.BytesIO()
+        wavfile.write(buf, self.sample_rate, self.to_int16())
+        return buf.getvalue()
+
+    def save(self, path: str) -> str:
+        """Persist the clip as 16-bit PCM WAV and remember where it went."""
+        from scipy.io import wavfile
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        wavfile.write(path, self.sample_rate, self.to_int16())
+        self.path = str(path)
+        return self.path
@@ -1,95 +1,275 @@
-import opensmile
-import librosa
 import numpy as np
-import scipy.io.wavfile as wavfile
 import os
+import queue
+import sys
 import time
 import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from tools import tracing
+from tools.audio_buffers import CaptureBuffer
+from tools.audio_clip import AudioClip
+from tools.artifact_store import get_artifact_store
+from tools.vad import EnergySegmenter, Endpointer
 
 SAMPLE_RATE = 16000
 CHANNELS = 1
-AUDIO_FILE = "data/temp_audio/user_input.wav"
 
-def record_user_input(duration=8):
-    os.makedirs(os.path.dirname(AUDIO_FILE), exist_ok=True)
+# Hands-free turn-taking: stop recording once the user has been quiet this long
+# (Enter still works), and drop the silence around the utterance
+ENDPOINTING = os.getenv("RECORD_ENDPOINTING", "1").strip().lower() not in {"0", "false", "no"}
+ENDPOINT_SILENCE_MS = int(os.getenv("ENDPOINT_SILENCE_MS", "1200"))
+ENDPOINT_PADDING_MS = int(os.getenv("ENDPOINT_PADDING_MS", "200"))
+VAD_ENERGY_THRESHOLD = float(os.getenv("VAD_ENERGY_THRESHOLD", "0.01"))
+# How often on_tick callers (streaming partials) are serviced while recording
+TICK_SECONDS = 0.1
+# Capture memory reserved up front; longer recordings grow it by doubling
+CAPTURE_PREALLOC_SECONDS = float(os.getenv("CAPTURE_PREALLOC_SECONDS", "60"))
 
-    frames = []
+# Building an eGeMAPS extractor is expensive; share one per process
+_SMILE = None
+_SMILE_LOCK = threading.RLock()
 
-    def callback(indata, frames_count, time_info, status):
-        if status:
-            print(f"InputStream status: {status}")
-        # copy the buffer since the memory gets reused by sounddevice
-        frames.append(indata.copy())
+# One stdin reader for the whole process. A per-recording input() thread would
+# outlive a recording that ended on silence and swallow the next Enter, so
+# every console prompt reads through this thread: lines go to the recording in
+# progress if there is one, otherwise to read_console_line().
+_stdin_thread = None
+_stdin_lines = queue.Queue()
+_active_stopper = None
+_stopper_lock = threading.Lock()
+
+def _deliver_line(line):
+    with _stopper_lock:
+        target = _active_stopper
+    if target is not None:
+        target[1]['value'] = line
+        target[0].set()
+    else:
+        _stdin_lines.put(line)
+
+def _stdin_loop():
+    # Raw reads on the descriptor: a daemon thread parked in input() holds the
+    # sys.stdin buffer lock and aborts interpreter shutdown
+    pending = b""
+    while True:
+        try:
+            chunk = os.read(sys.stdin.fileno(), 4096)
+        except (OSError, ValueError, AttributeError):
+            chunk = b""
+        if not chunk:
+            _deliver_line(None)
+            _stdin_lines.put(None)
+            return  # stdin closed; recordings still end on silence or duration
+        pending += chunk
+        while b"\n" in pending:
+            line, pending = pending.split(b"\n", 1)
+            _deliver_line(line.decode(errors="replace").rstrip("\r"))
+
+def _ensure_stdin_reader():
+    global _stdin_thread
+    with _stopper_lock:
+        if _stdin_thread is None:
+            _stdin_thread = threading.Thread(target=_stdin_loop, name="stdin-reader", daemon=True)
+            _stdin_thread.start()
+        return _stdin_thread
+
+def read_console_line(prompt=""):
+    """input() that shares stdin with the recorder's Enter-to-stop. Returns
+    None once stdin is closed."""
+    _ensure_stdin_reader()
+    if prompt:
+        print(prompt)
+    line = _stdin_lines.get()
+    if line is None:
+        _stdin_lines.put(None)  # keep reporting EOF to later callers
+    return line
 
+def _start_stopper():
+    global _active_stopper
     stop_event = threading.Event()
     stopper_input = {'value': None}
+    _ensure_stdin_reader()
+    # User can press Enter to stop recording early, or type a command to stop the session
+    with _stopper_lock:
+        _active_stopper = (stop_event, stopper_input)
+    return stop_event, stopper_input
 
-    def stopper():
-        try:
-            # User can press Enter to stop recording early, or type a command to stop the session
-            inp = input("Recording... press Enter to stop early, or type 'quit' to end the session:\n")
-            stopper_input['value'] = inp
-        except Exception:
-            stopper_input['value'] = None
-        finally:
+def _release_stopper(stop_event):
+    global _active_stopper
+    with _stopper_lock:
+        if _active_stopper is not None and _active_stopper[0] is stop_event:
+            _active_stopper = None
+
+def _capture(duration, on_frames=None, on_tick=None, endpointing=None):
+    """Record from the default input device until Enter, `duration` seconds or
+    (with endpointing) ENDPOINT_SILENCE_MS of silence after speech.
+    Returns (CaptureBuffer, stop_session, endpointer); endpointer is None
+    when endpointing is off."""
+    # One second of slack: the stream delivers a last block or two after the deadline
+    max_samples = int((duration + 1) * SAMPLE_RATE)
+    buffer = CaptureBuffer(int(min(duration, CAPTURE_PREALLOC_SECONDS) * SAMPLE_RATE), max_samples)
+    endpointing = ENDPOINTING if endpointing is None else endpointing
+    endpointer = Endpointer(
+        SAMPLE_RATE, threshold=VAD_ENERGY_THRESHOLD, trailing_silence_ms=ENDPOINT_SILENCE_MS
+    ) if endpointing else None
+    stop_event, stopper_input = _start_stopper()
+
+    def callback(indata, frames_count, time_info, status):
+        if status:
+            print(f"InputStream status: {status}")
+        # sounddevice reuses indata's memory; copy it straight into the arena
+        buffer.write(indata)
+        if on_frames is not None:
+            on_frames(indata)
+        if endpointer is not None and not endpointer.done and endpointer.process(indata[:, 0]):
             stop_event.set()
 
-    stopper_thread = threading.Thread(target=stopper, daemon=True)
-    stopper_thread.start()
+    # PortAudio is only needed once we actually record; keep it off the import path
+    import sounddevice as sd
 
-    print(f"Recording for up to {duration} seconds. Press Enter to stop early or type 'quit' to stop the session.")
-    with sd.InputStream(samplerate=SAMPLE_RATE, channels=CHANNELS, callback=callback, dtype='float32'):
-        start_time = time.time()
-        while not stop_event.is_set() and (time.time() - start_time) < duration:
-            time.sleep(0.1)
+    hint = "pause when you're done" if endpointer is not None else "press Enter to stop early"
+    print(f"Recording for up to {duration} seconds. Speak, then {hint}. Type 'quit' to stop the session.")
+    try:
+        with sd.InputStream(samplerate=SAMPLE_RATE, channels=CHANNELS, callback=callback, dtype='float32'):
+            deadline = time.monotonic() + duration
+            # Wakes as soon as Enter or the endpointer fires, not on the next poll
+            while not stop_event.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                stop_event.wait(min(TICK_SECONDS, remaining) if on_tick is not None else remaining)
+                if on_tick is not None:
+                    on_tick()
+    finally:
+        _release_stopper(stop_event)
 
     # Determine if the user requested to stop the entire session
     user_cmd = stopper_input.get('value')
     stop_session = False
     if isinstance(user_cmd, str) and user_cmd.strip().lower() in {"quit", "exit", "stop", "end"}:
         stop_session = True
+    if buffer.dropped:
+        print(f"Recording buffer full; dropped {buffer.dropped} samples.")
+    return buffer, stop_session, endpointer
+
+def _clip_from_buffer(buffer, persist=False, endpointer=None, session_id=None):
+    """Wrap the captured samples in a clip without copying, trimmed to the
+    detected speech when an endpointer ran. Returns None if it heard no speech.
+    With persist, the clip is also written to a per-session artifact file
+    that the caller holds a reference to (see tools/artifact_store.py)."""
+    samples = buffer.view()
+    if endpointer is not None:
+        bounds = endpointer.speech_bounds(ENDPOINT_PADDING_MS)
+        if bounds is None:
+            return None
+        samples = samples[bounds[0]:bounds[1]]
+    clip = AudioClip(samples, SAMPLE_RATE)
+    if persist:
+        filename = get_artifact_store().save_clip(clip, session_id)
+        print(f"Recording saved to {filename}")
+    return clip
 
-    if not frames:
+def record_user_input(duration=8, persist=False, endpointing=None, session_id=None):
+    """Record one utterance. Returns (AudioClip | None, stop_session); the clip is
+    only written to disk when persist=True, and the caller must then release it
+    through the artifact store. With endpointing (default:
+    RECORD_ENDPOINTING) recording ends on trailing silence and the clip is
+    trimmed to the speech."""
+    buffer, stop_session, endpointer = _capture(duration, endpointing=endpointing)
+
+    if not len(buffer):
         print("No audio captured.")
         return (None, stop_session)
 
-    audio_np = np.concatenate(frames, axis=0)
+    with tracing.span("recording_stop"):
+        clip = _clip_from_buffer(buffer, persist, endpointer, session_id)
+    if clip is None:
+        print("No speech detected.")
+    return (clip, stop_session)
 
-    if np.issubdtype(audio_np.dtype, np.floating):
-        audio_int16 = (audio_np * np.iinfo(np.int16).max).astype('int16')
-    else:
-        audio_int16 = audio_np
+def record_user_input_streaming(duration=600, on_partial=None, persist=False, endpointing=None, session_id=None):
+    """Like record_user_input, but transcribes speech segments while the user is
+    still talking. Returns (AudioClip | None, transcript, stop_session)."""
+    from tools.streaming_stt import StreamingTranscriber
+
+    # Segment with the endpointer's threshold, or quiet speech it accepts would never be transcribed
+    segmenter = EnergySegmenter(SAMPLE_RATE, threshold=VAD_ENERGY_THRESHOLD)
+    transcriber = StreamingTranscriber(sample_rate=SAMPLE_RATE, segmenter=segmenter).start()
+
+    def emit_partials():
+        for partial in transcriber.poll_partials():
+            if on_partial is not None:
+                on_partial(partial)
+
+    buffer, stop_session, endpointer = _capture(
+        duration, on_frames=transcriber.feed, on_tick=emit_partials, endpointing=endpointing
+    )
+    # What the user waits for after they stop talking: the last segment's transcription
+    with tracing.span("recording_stop", streaming=True):
+        transcript = transcriber.finish()
+    emit_partials()
+
+    if not len(buffer):
+        print("No audio captured.")
+        return (None, "", stop_session)
+
+    clip = _clip_from_buffer(buffer, persist, endpointer, session_id)
+    if clip is None:
+        print("No speech detected.")
+        return (None, "", stop_session)
+    return (clip, transcript, stop_session)
+
+def get_biomarker_extractor():
+    """Return the process-wide openSMILE extractor, building it on first use."""
+    global _SMILE
+    with _SMILE_LOCK:
+        if _SMILE is None:
+            import opensmile
 
-    timestamp = int(time.time() * 1000)
-    filename = f"data/temp_audio/user_input_{timestamp}.wav"
-    wavfile.write(filename, SAMPLE_RATE, audio_int16)
-    print(f"Recording saved to {filename}")
-    return (filename, stop_session)
+            _SMILE = opensmile.Smile(
+                feature_set=opensmile.FeatureSet.eGeMAPSv02,
+                feature_level=opensmile.FeatureLevel.Functionals,
+            )
+        return _SMILE
 
-def extract_vocal_biomarkers(audio_file_path):
+def _as_float_signal(signal):
+    signal = np.asarray(signal)
+    if np.issubdtype(signal.dtype, np.integer):
+        return signal.astype(np.float32) / np.iinfo(signal.dtype).max
+    return signal.astype(np.float32, copy=False)
+
+def _metrics_from_features(result_df):
+    metrics = {
+        "f0_mean": result_df['f0semitone_sma3nz_amean'].iloc[0],
+        "f0_stddev": result_df['f0semitone_sma3nz_stddevNorm'].iloc[0],
+        "jitter_local": result_df['jitterLocal_sma3nz_amean'].iloc[0],
+        "shimmer_local": result_df['shimmerLocal_sma3nz_amean'].iloc[0],
+        "loudness_mean": result_df['loudness_sma3_amean'].iloc[0],
+        "loudness_stddev": result_df['loudness_sma3_stddevNorm'].iloc[0],
+        "speaking_rate": result_df['speakingRate_sma3nz_amean'].iloc[0],
+    }
+    metrics["vocal_stability_score"] = 1 - metrics.get("jitter_local", 0)
+    for key, value in list(metrics.items()):
+        try:
+            if np.isnan(value):
+                metrics[key] = 0.0
+        except Exception:
+            pass
+    return metrics
+
+def extract_vocal_biomarkers(audio_file_path, sample_rate=SAMPLE_RATE):
+    """Extract eGeMAPS biomarkers from a WAV path, an AudioClip or a NumPy signal."""
     try:
-        extractor = opensmile.Smile(
-            feature_set=opensmile.FeatureSet.eGeMAPSv02,
-            feature_level=opensmile.FeatureLevel.Functionals,
-        )
-        result_df = extractor.process_file(audio_file_path)
-        metrics = {
-            "f0_mean": result_df['f0semitone_sma3nz_amean'].iloc[0],
-            "f0_stddev": result_df['f0semitone_sma3nz_stddevNorm'].iloc[0],
-            "jitter_local": result_df['jitterLocal_sma3nz_amean'].iloc[0],
-            "shimmer_local": result_df['shimmerLocal_sma3nz_amean'].iloc[0],
-            "loudness_mean": result_df['loudness_sma3_amean'].iloc[0],
-            "loudness_stddev": result_df['loudness_sma3_stddevNorm'].iloc[0],
-            "speaking_rate": result_df['speakingRate_sma3nz_amean'].iloc[0],
-        }
-        metrics["vocal_stability_score"] = 1 - metrics.get("jitter_local", 0)
-        for key, value in list(metrics.items()):
-            try:
-                if np.isnan(value):
-                    metrics[key] = 0.0
-            except Exception:
-                pass
-        return metrics
+        extractor = get_biomarker_extractor()
+        with _SMILE_LOCK:
+            if isinstance(audio_file_path, AudioClip):
+                result_df = extractor.process_signal(audio_file_path.samples, audio_file_path.sample_rate)
+            elif isinstance(audio_file_path, (str, os.PathLike)):
+                result_df = extractor.process_file(str(audio_file_path))
+            else:
+                result_df = extractor.process_signal(_as_float_signal(audio_file_path), sample_rate)
+        return _metrics_from_features(result_df)
     except Exception as e:
         print(f"Error during biomarker extraction: {e}")
         return {
@@ -99,6 +279,20 @@ def extract_vocal_biomarkers(audio_file_path):
             "error": str(e)
         }
 
+def extract_vocal_biomarkers_batch(sources, sample_rate=SAMPLE_RATE, processes=None):
+    """Extract biomarkers for many recordings (paths, AudioClips and/or NumPy signals) in one call.
+    With processes > 1 the work is spread over a process pool; each worker builds
+    its extractor once and reuses it for every item it handles."""
+    sources = list(sources)
+    if not processes or processes <= 1 or len(sources) < 2:
+        return [extract_vocal_biomarkers(source, sample_rate) for source in sources]
+
+    chunksize = max(1, len(sources) // (processes * 4))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(
+            extract_vocal_biomarkers, sources, [sample_rate] * len(sources), chunksize=chunksize
+        ))
+
 if __name__ == '__main__':
     print("Testing Audio Tools")
     recorded_file, session_active = record_user_input(duration=5)
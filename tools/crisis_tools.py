@@ -1,3 +1,10 @@
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
 CRISIS_RESOURCES = {
     "988": "988 Suicide & Crisis Lifeline (US/Canada) - Call or Text 988",
     "741741": "Crisis Text Line (US/Canada) - Text HOME to 741741",
@@ -7,4 +14,131 @@ CRISIS_RESOURCES = {
 def get_crisis_helpline(location="global"):
     if location == "global":
         return f"Immediate help: {CRISIS_RESOURCES['988']} or Text {CRISIS_RESOURCES['741741']}."
-    return CRISIS_RESOURCES['LOCAL_INTL_RESOURCE']
\ No newline at end of file
+    return CRISIS_RESOURCES['LOCAL_INTL_RESOURCE']
+
+# ----------------------------------------------------------------
+# CRISIS KEYWORD MATCHING
+# ----------------------------------------------------------------
+
+# Locale -> list of phrases. Edits are picked up without a restart.
+CRISIS_KEYWORDS_PATH = os.getenv(
+    "CRISIS_KEYWORDS_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "crisis_keywords.json")
+)
+CRISIS_KEYWORDS_RELOAD_SECONDS = float(os.getenv("CRISIS_KEYWORDS_RELOAD_SECONDS", "5"))
+
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+_matcher_cache = {"key": None, "matcher": None, "checked_at": 0.0}
+_matcher_lock = threading.Lock()
+
+
+def normalize_text(text: str) -> str:
+    """Casefold, strip accents, and turn punctuation/whitespace runs into single spaces."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return _NON_WORD.sub(" ", text.casefold()).strip()
+
+
+def _token_pattern(token: str) -> str:
+    # Cheap inflection handling: "suicide" -> suicidal/suicides, "harm" -> harming/harmed
+    if len(token) < 4 or not token.isalpha():
+        return re.escape(token)
+    if token.endswith("e"):
+        return re.escape(token[:-1]) + "(?:e|es|ed|ing|al)"
+    return re.escape(token) + "(?:s|es|ed|ing)?"
+
+
+def _keyword_pattern(keyword: str) -> str:
+    return r"\s+".join(_token_pattern(token) for token in normalize_text(keyword).split())
+
+
+class CrisisKeywordMatcher:
+    """
+    Every keyword of every locale compiled into one alternation regex, so a
+    transcript is scanned once regardless of how many phrases are configured.
+    Both the phrases and the scanned text go through normalize_text().
+    """
+
+    def __init__(self, keywords_by_locale: dict):
+        entries = {}
+        for locale, keywords in keywords_by_locale.items():
+            for keyword in keywords:
+                pattern = _keyword_pattern(keyword)
+                if pattern:
+                    entries.setdefault(pattern, []).append((locale, keyword))
+        # Longest patterns first so overlapping phrases report the most specific one
+        self._patterns = sorted(entries, key=len, reverse=True)
+        self._keywords = [entries[p] for p in self._patterns]
+        self.locales = sorted(keywords_by_locale)
+        if self._patterns:
+            self._regex = re.compile(
+                r"\b(?:" + "|".join(f"({p})" for p in self._patterns) + r")\b", re.UNICODE
+            )
+        else:
+            self._regex = None
+
+    def __len__(self):
+        return len(self._patterns)
+
+    @classmethod
+    def from_file(cls, path: str, extra_keywords: dict = None):
+        with open(path, "r", encoding="utf-8") as f:
+            keywords = json.load(f)
+        for locale, phrases in (extra_keywords or {}).items():
+            keywords.setdefault(locale, [])
+            keywords[locale] = list(keywords[locale]) + list(phrases)
+        return cls(keywords)
+
+    def find_all(self, text: str, locales=None) -> list:
+        """Return [(locale, keyword), ...] for every match, in transcript order."""
+        if self._regex is None:
+            return []
+        matches = []
+        for m in self._regex.finditer(normalize_text(text)):
+            for locale, keyword in self._keywords[m.lastindex - 1]:
+                if locales is None or locale in locales:
+                    matches.append((locale, keyword))
+        return matches
+
+    def search(self, text: str, locales=None):
+        """Return the first (locale, keyword) match, or None."""
+        if self._regex is None:
+            return None
+        for m in self._regex.finditer(normalize_text(text)):
+            for locale, keyword in self._keywords[m.lastindex - 1]:
+                if locales is None or locale in locales:
+                    return (locale, keyword)
+        return None
+
+
+def get_crisis_matcher(default_keywords=None, path=None) -> CrisisKeywordMatcher:
+    """
+    Return the shared matcher, rebuilding it only when the keyword file changes
+    (checked at most every CRISIS_KEYWORDS_RELOAD_SECONDS). `default_keywords`
+    are always included under "en", so a missing or broken file never disables
+    the check.
+    """
+    path = path or CRISIS_KEYWORDS_PATH
+    defaults = tuple(default_keywords or ())
+    now = time.monotonic()
+    with _matcher_lock:
+        cached = _matcher_cache["matcher"]
+        if cached is not None and now - _matcher_cache["checked_at"] < CRISIS_KEYWORDS_RELOAD_SECONDS \
+                and _matcher_cache["key"][:2] == (path, defaults):
+            return cached
+        _matcher_cache["checked_at"] = now
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            mtime = None
+        key = (path, defaults, mtime)
+        if cached is not None and _matcher_cache["key"] == key:
+            return cached
+        try:
+            if mtime is None:
+                raise FileNotFoundError(path)
+            matcher = CrisisKeywordMatcher.from_file(path, {"en": defaults})
+        except Exception as e:
+            print(f"Could not load crisis keywords from {path} ({e}); using built-in list.")
+            matcher = CrisisKeywordMatcher({"en": defaults})
+        _matcher_cache.update(key=key, matcher=matcher)
+        return matcher
@@ -0,0 +1,386 @@
+# tools/genai_client.py
+"""
+One shared, resilient Gemini client for the whole process.
+
+Every agent used to build its own genai.Client() at import time and call it
+with no timeout, retry or rate limit, so a burst of 429s turned into empty
+replies and zero scores. get_genai_client() returns a single wrapped client
+(one HTTP connection pool, reused across calls) that adds, per model:
+
+  - a token-bucket rate limiter (GENAI_RATE_LIMITS, requests per minute),
+  - jittered exponential retries for 408/429/5xx and transport errors,
+  - a circuit breaker that fails fast while the model keeps erroring,
+  - deadline propagation: calls made inside `with deadline(seconds):` stop
+    retrying, waiting or sending once the deadline has passed.
+
+When a call cannot succeed it raises GenAIUnavailable instead of returning a
+placeholder. GENAI_BACKEND=stub swaps in tools/genai_stub.StubClient for
+offline runs.
+"""
+import asyncio
+import contextlib
+import contextvars
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+GENAI_BACKEND = os.getenv("GENAI_BACKEND", "google").strip().lower()  # "google" or "stub"
+GENAI_TIMEOUT_SECONDS = float(os.getenv("GENAI_TIMEOUT_SECONDS", "30"))
+GENAI_MAX_RETRIES = int(os.getenv("GENAI_MAX_RETRIES", "4"))
+GENAI_RETRY_BASE_SECONDS = float(os.getenv("GENAI_RETRY_BASE_SECONDS", "0.5"))
+GENAI_RETRY_MAX_SECONDS = float(os.getenv("GENAI_RETRY_MAX_SECONDS", "8"))
+# Requests per minute per model, e.g. "gemini-2.5-flash=300,gemini-2.5-pro=60"
+GENAI_RATE_LIMITS = os.getenv("GENAI_RATE_LIMITS", "gemini-2.5-flash=300,gemini-2.5-pro=60")
+GENAI_DEFAULT_RPM = float(os.getenv("GENAI_DEFAULT_RPM", "120"))
+GENAI_BREAKER_THRESHOLD = int(os.getenv("GENAI_BREAKER_THRESHOLD", "5"))
+GENAI_BREAKER_COOLDOWN_SECONDS = float(os.getenv("GENAI_BREAKER_COOLDOWN_SECONDS", "30"))
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class GenAIUnavailable(RuntimeError):
+    """A Gemini call gave up: retries exhausted, deadline passed or circuit open."""
+
+
+def _parse_rate_limits(spec):
+    limits = {}
+    for item in spec.split(","):
+        model, _, rpm = item.partition("=")
+        if model.strip() and rpm.strip():
+            limits[model.strip()] = float(rpm)
+    return limits
+
+
+# ----------------------------------------------------------------
+# DEADLINES
+# ----------------------------------------------------------------
+_deadline = contextvars.ContextVar("genai_deadline", default=None)
+
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """Bound every GenAI call made inside the block (retries and waits included).
+    Nested deadlines keep the earlier of the two."""
+    new = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(new if current is None else min(new, current))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_time():
+    """Seconds left before the current deadline, or None if there is none."""
+    current = _deadline.get()
+    return None if current is None else current - time.monotonic()
+
+
+# ----------------------------------------------------------------
+# RATE LIMITING AND CIRCUIT BREAKING
+# ----------------------------------------------------------------
+class TokenBucket:
+    """Requests-per-minute limiter. reserve() takes a token now and returns how
+    long the caller must wait before using it, so sync and async callers share it."""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1.0, self.rate * 10)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def refund(self):
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `cooldown` seconds
+    lets one trial call through and closes again if it succeeds."""
+
+    def __init__(self, threshold=GENAI_BREAKER_THRESHOLD, cooldown=GENAI_BREAKER_COOLDOWN_SECONDS):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown or self._trial:
+                return False
+            self._trial = True
+            return True
+
+    def cancel_trial(self):
+        """Give back a trial slot that allow() handed out but was never used."""
+        with self._lock:
+            self._trial = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._trial = False
+
+
+def is_retryable(error) -> bool:
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if isinstance(code, int):
+        return code in RETRYABLE_STATUS
+    if isinstance(error, (TimeoutError, ConnectionError)):
+        return True
+    # httpx transport errors (timeouts, resets) raised from inside the genai SDK
+    return type(error).__module__.startswith("httpx")
+
+
+# ----------------------------------------------------------------
+# CLIENT WRAPPER
+# ----------------------------------------------------------------
+class _Attempts:
+    """Retry bookkeeping for one logical call; shared by the sync and async paths."""
+
+    def __init__(self, owner, model):
+        self.owner = owner
+        self.model = model
+        self.breaker = owner.breaker(model)
+        self.bucket = owner.bucket(model)
+        self.attempt = 0
+        self.last_error = None
+
+    def _give_up(self, reason):
+        self.owner.stats["gave_up"] += 1
+        error = GenAIUnavailable(f"{self.model}: {reason}" + (f" (last error: {self.last_error})" if self.last_error else ""))
+        raise error from self.last_error
+
+    def before(self) -> float:
+        """Check deadline and breaker, take a rate token; returns seconds to wait."""
+        remaining = remaining_time()
+        if remaining is not None and remaining <= 0:
+            self._give_up("deadline exceeded")
+        if not self.breaker.allow():
+            self.owner.stats["rejected"] += 1
+            self._give_up("circuit open")
+        wait = self.bucket.reserve()
+        if remaining is not None and wait >= remaining:
+            self.bucket.refund()
+            self.breaker.cancel_trial()
+            self._give_up("rate limit wait exceeds deadline")
+        if wait:
+            self.owner.stats["throttled"] += 1
+        return wait
+
+    def config(self, config):
+        """Shorten the request timeout to the deadline when that is tighter."""
+        remaining = remaining_time()
+        if remaining is None or remaining >= self.owner.timeout or not isinstance(config, (dict, type(None))):
+            return config
+        config = dict(config or {})
+        config["http_options"] = {"timeout": max(1, int(remaining * 1000))}
+        return config
+
+    def succeeded(self):
+        self.breaker.record_success()
+        self.owner.stats["calls"] += 1
+
+    def failed(self, error) -> float:
+        """Record a failure; re-raises it if it isn't worth retrying, else returns the backoff."""
+        if not is_retryable(error):
+            # The service answered (bad request, auth...); that says nothing about its health
+            self.breaker.record_success()
+            self.owner.stats["errors"] += 1
+            raise error
+        self.breaker.record_failure()
+        self.last_error = error
+        self.attempt += 1
+        if self.attempt > self.owner.max_retries:
+            self._give_up(f"failed after {self.attempt} attempts")
+        self.owner.stats["retries"] += 1
+        delay = random.uniform(0, min(self.owner.retry_max, self.owner.retry_base * (2 ** self.attempt)))
+        remaining = remaining_time()
+        if remaining is not None and delay >= remaining:
+            self._give_up("deadline exceeded")
+        return delay
+
+
+class _Models:
+    def __init__(self, owner):
+        self._owner = owner
+
+    def generate_content(self, model, contents, config=None):
+        owner = self._owner
+        attempts = _Attempts(owner, model)
+        while True:
+            wait = attempts.before()
+            if wait:
+                time.sleep(wait)
+            try:
+                response = owner.raw.models.generate_content(model=model, contents=contents, config=attempts.config(config))
+            except Exception as e:
+                time.sleep(attempts.failed(e))
+                continue
+            attempts.succeeded()
+            return response
+
+    def generate_content_stream(self, model, contents, config=None):
+        # Retries only until the first chunk arrives; after that the caller has
+        # already seen partial output, so a mid-stream error is raised as-is
+        owner = self._owner
+        attempts = _Attempts(owner, model)
+        while True:
+            wait = attempts.before()
+            if wait:
+                time.sleep(wait)
+            try:
+                stream = iter(owner.raw.models.generate_content_stream(model=model, contents=contents, config=attempts.config(config)))
+                first = next(stream, None)
+            except Exception as e:
+                time.sleep(attempts.failed(e))
+                continue
+            break
+        try:
+            if first is not None:
+                yield first
+            yield from stream
+        except GeneratorExit:
+            attempts.succeeded()  # the caller stopped reading; the model was fine
+            raise
+        except Exception:
+            attempts.breaker.record_failure()
+            raise
+        attempts.succeeded()
+
+
+class _AsyncModels:
+    def __init__(self, owner):
+        self._owner = owner
+
+    async def generate_content(self, model, contents, config=None):
+        owner = self._owner
+        attempts = _Attempts(owner, model)
+        while True:
+            wait = attempts.before()
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                response = await owner.raw.aio.models.generate_content(model=model, contents=contents, config=attempts.config(config))
+            except Exception as e:
+                await asyncio.sleep(attempts.failed(e))
+                continue
+            attempts.succeeded()
+            return response
+
+
+class ResilientClient:
+    """Wraps a genai.Client (or StubClient) with the policies described above.
+    Exposes the same models / aio.models surface the agents use."""
+
+    def __init__(self, raw=None, factory=None, timeout=GENAI_TIMEOUT_SECONDS, max_retries=GENAI_MAX_RETRIES,
+                 retry_base=GENAI_RETRY_BASE_SECONDS, retry_max=GENAI_RETRY_MAX_SECONDS, rate_limits=None):
+        # With `factory`, the underlying client (and the google.genai import) is
+        # only built on first use, which keeps it off the startup path
+        self._raw = raw
+        self._factory = factory
+        self._raw_lock = threading.Lock()
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.rate_limits = rate_limits if rate_limits is not None else _parse_rate_limits(GENAI_RATE_LIMITS)
+        self._buckets = {}
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "retries": 0, "throttled": 0, "rejected": 0, "errors": 0, "gave_up": 0}
+        self.models = _Models(self)
+        self.aio = SimpleNamespace(models=_AsyncModels(self))
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            with self._raw_lock:
+                if self._raw is None:
+                    self._raw = self._factory()
+        return self._raw
+
+    def bucket(self, model) -> TokenBucket:
+        with self._lock:
+            if model not in self._buckets:
+                self._buckets[model] = TokenBucket(self.rate_limits.get(model, GENAI_DEFAULT_RPM))
+            return self._buckets[model]
+
+    def breaker(self, model) -> CircuitBreaker:
+        with self._lock:
+            if model not in self._breakers:
+                self._breakers[model] = CircuitBreaker()
+            return self._breakers[model]
+
+    def metrics(self) -> dict:
+        with self._lock:
+            breakers = {model: b.state for model, b in self._breakers.items()}
+        return dict(self.stats, breakers=breakers)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def create_raw_client(api_key=None, backend=None):
+    backend = backend or GENAI_BACKEND
+    if backend == "stub":
+        from tools.genai_stub import StubClient
+
+        return StubClient()
+    from google import genai
+
+    # One Client per process keeps its HTTP connection pool (keep-alive) warm
+    http_options = {"timeout": int(GENAI_TIMEOUT_SECONDS * 1000)}
+    if api_key:
+        return genai.Client(api_key=api_key, http_options=http_options)
+    return genai.Client(http_options=http_options)
+
+
+def _has_credentials(api_key=None):
+    return bool(
+        api_key or os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
+        or os.getenv("GOOGLE_GENAI_USE_VERTEXAI", "").strip().lower() in {"1", "true"}
+    )
+
+
+def get_genai_client(api_key=None):
+    """The process-wide ResilientClient, or None if no credentials are
+    configured. The underlying client is created lazily on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            if GENAI_BACKEND != "stub" and not _has_credentials(api_key):
+                print("GenAI client not initialized: no API key configured.")
+                return None
+            _client = ResilientClient(factory=lambda: create_raw_client(api_key))
+        return _client
@@ -0,0 +1,105 @@
+# tools/genai_stub.py
+"""
+In-process stand-in for google.genai.Client, for exercising the agents without
+network access or an API key. It implements the parts of the client SerenAI
+uses (models.generate_content / generate_content_stream and
+aio.models.generate_content), records every call, and reports prompt and
+reply token counts the way the real usage_metadata does.
+"""
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+DEFAULT_REPLY = "That sounds like a lot to carry. I'm glad you told me. What's been on your mind most today?"
+DEFAULT_ANALYSIS = {
+    "mood_score": 6,
+    "anxiety_score": 4,
+    "risk_level": 0,
+    "topics_discussed": ["daily check-in"],
+    "sentiment_summary": "The user checked in and shared how their day went.",
+    "profile_trait": None,
+}
+
+
+def _count_tokens(text):
+    return (len(text or "") + 3) // 4
+
+
+def _config_value(config, key):
+    if config is None:
+        return None
+    if isinstance(config, dict):
+        return config.get(key)
+    return getattr(config, key, None)
+
+
+def _contents_text(contents):
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (list, tuple)):
+        return "\n".join(_contents_text(c) for c in contents)
+    return str(contents)
+
+
+class _StubModels:
+    def __init__(self, stub):
+        self._stub = stub
+
+    def generate_content(self, model, contents, config=None):
+        return self._stub._respond(model, contents, config)
+
+    def generate_content_stream(self, model, contents, config=None):
+        response = self._stub._respond(model, contents, config, stream=True)
+        words = response.text.split(" ")
+        for i, word in enumerate(words):
+            if i and self._stub.token_latency:
+                time.sleep(self._stub.token_latency)
+            yield SimpleNamespace(text=word + (" " if i < len(words) - 1 else ""),
+                                  usage_metadata=response.usage_metadata)
+
+
+class _StubAsyncModels:
+    def __init__(self, stub):
+        self._stub = stub
+
+    async def generate_content(self, model, contents, config=None):
+        if self._stub.latency:
+            await asyncio.sleep(self._stub.latency)
+        return self._stub._respond(model, contents, config, sleep=False)
+
+
+class StubClient:
+    """
+    Fake genai client. `reply` is a string or a callable(model, prompt_text,
+    config) -> str; requests asking for JSON get `analysis` instead. `latency`
+    is added before each response and `token_latency` between streamed words.
+    """
+
+    def __init__(self, reply=DEFAULT_REPLY, analysis=None, latency=0.0, token_latency=0.0):
+        self.reply = reply
+        self.analysis = analysis or DEFAULT_ANALYSIS
+        self.latency = latency
+        self.token_latency = token_latency
+        self.calls = []
+        self.models = _StubModels(self)
+        self.aio = SimpleNamespace(models=_StubAsyncModels(self))
+
+    def _respond(self, model, contents, config, stream=False, sleep=True):
+        if sleep and self.latency:
+            time.sleep(self.latency)
+        prompt = _contents_text(contents)
+        instruction = _config_value(config, "system_instruction") or ""
+        self.calls.append(("stream" if stream else "generate", model, prompt, config))
+        if _config_value(config, "response_mime_type") == "application/json":
+            text = json.dumps(self.analysis)
+        elif callable(self.reply):
+            text = self.reply(model, prompt, config)
+        else:
+            text = self.reply
+        usage = SimpleNamespace(
+            prompt_token_count=_count_tokens(instruction) + _count_tokens(prompt),
+            cached_content_token_count=0,
+            candidates_token_count=_count_tokens(text),
+        )
+        return SimpleNamespace(text=text, usage_metadata=usage)
@@ -1,146 +1,578 @@
 import os
 import sqlite3
 import datetime
+import contextlib
+import queue
+import threading
+import time
 
 DB_PATH = 'data/user_history.db'
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DEFAULT_USER_ID = 'default'
+# Raw daily_logs rows older than this many days are deleted at startup by
+# compact_old_logs(); their per-day aggregates stay in daily_rollups.
+# Unset, empty or 0 keeps every raw row (compaction is opt-in).
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS") or 0)
+# A logged turn with mood_score below this counts towards the low-mood streak
+LOW_MOOD_THRESHOLD = 4
 
-def create_connection():
-    """Create an sqlite3 connection. If the existing file is not a valid SQLite DB,
-    back it up and create a fresh database file.
+_pool = None
+_pool_lock = threading.Lock()
+_verified_paths = set()
+# Bumped after every committed write, so read caches can key on it
+_write_version = 0
+_write_version_lock = threading.Lock()
+
+# Statements are kept as constants so sqlite3's per-connection statement cache
+# reuses the prepared form instead of re-parsing on every call.
+_INSERT_LOG_SQL = '''
+    INSERT INTO daily_logs (
+        timestamp, session_id, transcript_summary, mood_score, anxiety_score, 
+        risk_level, jitter_score, loudness_mean, ts_epoch, user_id
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+_REPLACE_TRAIT_SQL = '''
+    REPLACE INTO user_profile (user_id, trait_key, trait_value, last_updated)
+    VALUES (?, ?, ?, ?)
+'''
+# Explicit column list keeps the historical row shape (id, timestamp, session_id, ...)
+_RECENT_HISTORY_SQL = '''
+    SELECT id, timestamp, session_id, transcript_summary, mood_score, anxiety_score,
+           risk_level, jitter_score, loudness_mean
+    FROM daily_logs 
+    WHERE user_id = ? AND ts_epoch >= ? 
+    ORDER BY ts_epoch DESC
+    LIMIT ?
+'''
+_ROLLUP_SQL = '''
+    SELECT day, entries, mood_sum, mood_count, mood_min, mood_max,
+           anxiety_sum, anxiety_count, risk_max
+    FROM daily_rollups
+    WHERE user_id = ? AND day >= ?
+    ORDER BY day DESC
+'''
+_PROFILE_SQL = 'SELECT trait_key, trait_value FROM user_profile WHERE user_id = ?'
+_PROFILE_TRAITS_SQL = '''
+    SELECT trait_key, trait_value, last_updated
+    FROM user_profile
+    WHERE user_id = ?
+    ORDER BY last_updated DESC
+    LIMIT ?
+'''
+
+# Merge rule shared by every write into daily_rollups (sums add, extremes widen)
+_ROLLUP_MERGE = '''
+    ON CONFLICT(user_id, day) DO UPDATE SET
+        entries = entries + excluded.entries,
+        mood_sum = mood_sum + excluded.mood_sum,
+        mood_count = mood_count + excluded.mood_count,
+        mood_min = MIN(COALESCE(mood_min, excluded.mood_min), COALESCE(excluded.mood_min, mood_min)),
+        mood_max = MAX(COALESCE(mood_max, excluded.mood_max), COALESCE(excluded.mood_max, mood_max)),
+        anxiety_sum = anxiety_sum + excluded.anxiety_sum,
+        anxiety_count = anxiety_count + excluded.anxiety_count,
+        risk_max = MAX(COALESCE(risk_max, excluded.risk_max), COALESCE(excluded.risk_max, risk_max))
+'''
+_UPSERT_ROLLUP_SQL = '''
+    INSERT INTO daily_rollups (
+        user_id, day, entries, mood_sum, mood_count, mood_min, mood_max,
+        anxiety_sum, anxiety_count, risk_max
+    ) VALUES (
+        :user_id, :day, 1, COALESCE(:mood, 0), :mood IS NOT NULL, :mood, :mood,
+        COALESCE(:anxiety, 0), :anxiety IS NOT NULL, :risk
+    )
+''' + _ROLLUP_MERGE
+# low_run_start_epoch marks where the current run of low-mood entries began
+# (NULL when the latest scored entry wasn't low)
+_UPSERT_TREND_SQL = '''
+    INSERT INTO mood_trend_state (user_id, low_mood_streak, last_log_epoch, low_run_start_epoch)
+    VALUES (:user_id, COALESCE(:is_low, 0), :ts_epoch, CASE WHEN :is_low THEN :ts_epoch END)
+    ON CONFLICT(user_id) DO UPDATE SET
+        low_mood_streak = CASE
+            WHEN :is_low IS NULL THEN low_mood_streak
+            WHEN :is_low THEN low_mood_streak + 1
+            ELSE 0
+        END,
+        low_run_start_epoch = CASE
+            WHEN :is_low IS NULL THEN low_run_start_epoch
+            WHEN :is_low THEN COALESCE(low_run_start_epoch, :ts_epoch)
+            ELSE NULL
+        END,
+        last_log_epoch = MAX(last_log_epoch, excluded.last_log_epoch)
+'''
+_TREND_TOTALS_SQL = '''
+    SELECT COALESCE(SUM(entries), 0), COALESCE(SUM(anxiety_sum), 0), COALESCE(SUM(anxiety_count), 0)
+    FROM daily_rollups
+    WHERE user_id = ? AND day >= ?
+'''
+_TREND_STATE_SQL = 'SELECT low_run_start_epoch FROM mood_trend_state WHERE user_id = ?'
+# Entries of the current low run that fall inside the window (index range scan)
+_LOW_RUN_IN_WINDOW_SQL = '''
+    SELECT COUNT(*) FROM daily_logs
+    WHERE user_id = ? AND ts_epoch >= ? AND mood_score < ?
+'''
+
+def _verify_database(path):
+    """Check once per process that `path` is a valid SQLite DB. If it is not,
+    back it up so a fresh database file gets created.
     """
+    if path in _verified_paths:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
     try:
-        conn = sqlite3.connect(DB_PATH)
-        # Quick sanity-check: try a simple query against sqlite_master
+        conn = sqlite3.connect(path)
         try:
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table' LIMIT 1;")
-            _ = cursor.fetchall()
-        except sqlite3.DatabaseError:
-            # The file exists but is not a valid database
+            # Quick sanity-check: try a simple query against sqlite_master
+            conn.execute("SELECT name FROM sqlite_master WHERE type='table' LIMIT 1;").fetchall()
+        finally:
             conn.close()
-            raise sqlite3.DatabaseError("Existing file is not a valid SQLite database")
-        return conn
     except sqlite3.DatabaseError as e:
         print(f"Existing DB file appears invalid: {e}")
-        # Attempt to back up the corrupt file and create a new one
         try:
-            if os.path.exists(DB_PATH):
-                backup_name = DB_PATH + ".corrupt." + datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-                os.rename(DB_PATH, backup_name)
+            if os.path.exists(path):
+                backup_name = path + ".corrupt." + datetime.datetime.now().strftime("%Y%m%d%H%M%S")
+                os.rename(path, backup_name)
                 print(f"Backed up invalid DB to: {backup_name}")
         except Exception as be:
             print(f"Failed to back up invalid DB file: {be}")
+    _verified_paths.add(path)
+
+def _open_connection(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, cached_statements=256)
+    # WAL lets readers proceed while a writer commits; NORMAL sync is durable enough under WAL
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA cache_size=-8000")  # ~8 MB page cache
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except sqlite3.Error:
+        pass
+
+class ConnectionPool:
+    """A small pool of persistent, pre-tuned connections shared across threads.
+    Connections are opened lazily up to `size`; callers beyond that wait for one
+    to be returned.
+    """
+
+    def __init__(self, path, size=DB_POOL_SIZE, acquire_timeout=30.0):
+        self.path = path
+        self.size = max(1, size)
+        self.acquire_timeout = acquire_timeout
+        self._idle = queue.LifoQueue()
+        self._all = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @contextlib.contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._release(conn)
+
+    def _acquire(self):
+        if self._closed:
+            raise sqlite3.ProgrammingError("Cannot use a closed connection pool")
         try:
-            conn = sqlite3.connect(DB_PATH)
-            return conn
-        except sqlite3.Error as e2:
-            print(f"Database connection error after recreating DB: {e2}")
-            return None
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if len(self._all) < self.size:
+                    conn = _open_connection(self.path)
+                    self._all.append(conn)
+                    return conn
+            try:
+                conn = self._idle.get(timeout=self.acquire_timeout)
+            except queue.Empty:
+                raise sqlite3.OperationalError("Timed out waiting for a pooled database connection")
+        if conn is None:
+            # close() woke us; pass the wake-up on to the next waiter
+            self._idle.put(None)
+            raise sqlite3.ProgrammingError("Cannot use a closed connection pool")
+        return conn
+
+    def _release(self, conn):
+        with self._lock:
+            if not self._closed:
+                self._idle.put(conn)
+                return
+            # Checked out when the pool was closed: close it now it's back
+            if conn in self._all:
+                self._all.remove(conn)
+        _close_quietly(conn)
+
+    def close(self):
+        """Close idle connections now and checked-out ones as they are returned."""
+        with self._lock:
+            self._closed = True
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                if conn is not None:
+                    self._all.remove(conn)
+                    _close_quietly(conn)
+            self._idle.put(None)  # wakes callers waiting in _acquire
+
+def get_pool():
+    """Return the process-wide pool for DB_PATH (rebuilt if DB_PATH changes)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.path != DB_PATH:
+            if _pool is not None:
+                _pool.close()
+            _verify_database(DB_PATH)
+            _pool = ConnectionPool(DB_PATH)
+        return _pool
+
+def close_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+def create_connection():
+    """Create a standalone, tuned sqlite3 connection (caller closes it).
+    Regular reads and writes go through the shared pool instead.
+    """
+    try:
+        _verify_database(DB_PATH)
+        return _open_connection(DB_PATH)
     except sqlite3.Error as e:
         print(f"Database connection error: {e}")
         return None
 
-def setup_database():
-    conn = create_connection()
-    if conn is not None:
+def _to_epoch(timestamp):
+    """ISO-8601 text (local time, as written by datetime.isoformat()) -> epoch seconds."""
+    if timestamp is None:
+        return None
+    try:
+        return int(datetime.datetime.fromisoformat(str(timestamp)).timestamp())
+    except ValueError:
+        return None
+
+def _to_score(value):
+    """A score as float, or None when it is missing or not a number."""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _local_day_start(days_ago=0):
+    day = datetime.date.today() - datetime.timedelta(days=days_ago)
+    return datetime.datetime.combine(day, datetime.time.min)
+
+# ----------------------------------------------------------------
+# SCHEMA MIGRATIONS
+# Each migration runs once, in order, inside its own transaction; the applied
+# version is tracked in PRAGMA user_version. Append new migrations, never edit
+# ones that have shipped.
+# ----------------------------------------------------------------
+def _migration_1_base_tables(conn):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_logs (
+            id INTEGER PRIMARY KEY,
+            timestamp TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            transcript_summary TEXT,
+            mood_score REAL,
+            anxiety_score REAL,
+            risk_level INTEGER,
+            jitter_score REAL,
+            loudness_mean REAL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_profile (
+            trait_key TEXT PRIMARY KEY,
+            trait_value TEXT,
+            last_updated TEXT
+        )
+    ''')
+
+def _migration_2_epoch_indexes_rollups(conn):
+    # Integer epoch column for range scans; the ISO text column is kept for display
+    conn.execute("ALTER TABLE daily_logs ADD COLUMN ts_epoch INTEGER")
+    conn.execute(f"ALTER TABLE daily_logs ADD COLUMN user_id TEXT NOT NULL DEFAULT '{DEFAULT_USER_ID}'")
+    conn.create_function("iso_to_epoch", 1, _to_epoch, deterministic=True)
+    conn.execute("UPDATE daily_logs SET ts_epoch = COALESCE(iso_to_epoch(timestamp), 0)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_daily_logs_ts ON daily_logs(ts_epoch)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_daily_logs_user_ts ON daily_logs(user_id, ts_epoch)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_daily_logs_session ON daily_logs(session_id)")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_rollups (
+            user_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            entries INTEGER NOT NULL DEFAULT 0,
+            mood_sum REAL NOT NULL DEFAULT 0,
+            mood_count INTEGER NOT NULL DEFAULT 0,
+            mood_min REAL,
+            mood_max REAL,
+            anxiety_sum REAL NOT NULL DEFAULT 0,
+            anxiety_count INTEGER NOT NULL DEFAULT 0,
+            risk_max INTEGER,
+            PRIMARY KEY (user_id, day)
+        )
+    ''')
+
+def _migration_3_incremental_trend_state(conn):
+    # From here on save_daily_log keeps daily_rollups current, so fold in every
+    # raw row once (compaction is day-aligned, so these days are not rolled up yet)
+    conn.execute('''
+        INSERT INTO daily_rollups (
+            user_id, day, entries, mood_sum, mood_count, mood_min, mood_max,
+            anxiety_sum, anxiety_count, risk_max
+        )
+        SELECT user_id, date(ts_epoch, 'unixepoch', 'localtime') AS day, COUNT(*),
+               COALESCE(SUM(mood_score), 0), COUNT(mood_score), MIN(mood_score), MAX(mood_score),
+               COALESCE(SUM(anxiety_score), 0), COUNT(anxiety_score), MAX(risk_level)
+        FROM daily_logs
+        WHERE true
+        GROUP BY user_id, day
+    ''' + _ROLLUP_MERGE)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS mood_trend_state (
+            user_id TEXT PRIMARY KEY,
+            low_mood_streak INTEGER NOT NULL DEFAULT 0,
+            last_log_epoch INTEGER,
+            low_run_start_epoch INTEGER
+        )
+    ''')
+    streaks = {}
+    rows = conn.execute(
+        "SELECT user_id, mood_score, ts_epoch FROM daily_logs ORDER BY user_id, ts_epoch, id"
+    )
+    for user_id, mood, ts_epoch in rows:
+        streak, start, _ = streaks.get(user_id, (0, None, None))
+        mood = _to_score(mood)  # non-numeric scores stored before validation count as missing
+        if mood is not None:
+            if mood < LOW_MOOD_THRESHOLD:
+                streak, start = streak + 1, start if start is not None else ts_epoch
+            else:
+                streak, start = 0, None
+        streaks[user_id] = (streak, start, ts_epoch)
+    conn.executemany(
+        "INSERT OR REPLACE INTO mood_trend_state (user_id, low_mood_streak, low_run_start_epoch, last_log_epoch) "
+        "VALUES (?, ?, ?, ?)",
+        [(user_id, *state) for user_id, state in streaks.items()],
+    )
+
+def _migration_4_per_user_profile(conn):
+    # SQLite cannot change a primary key in place, so rebuild the table keyed by (user_id, trait_key)
+    conn.execute('''
+        CREATE TABLE user_profile_v4 (
+            user_id TEXT NOT NULL DEFAULT 'default',
+            trait_key TEXT NOT NULL,
+            trait_value TEXT,
+            last_updated TEXT,
+            PRIMARY KEY (user_id, trait_key)
+        )
+    ''')
+    conn.execute(
+        "INSERT INTO user_profile_v4 (user_id, trait_key, trait_value, last_updated) "
+        "SELECT ?, trait_key, trait_value, last_updated FROM user_profile",
+        (DEFAULT_USER_ID,),
+    )
+    conn.execute("DROP TABLE user_profile")
+    conn.execute("ALTER TABLE user_profile_v4 RENAME TO user_profile")
+
+SCHEMA_MIGRATIONS = [
+    (1, _migration_1_base_tables),
+    (2, _migration_2_epoch_indexes_rollups),
+    (3, _migration_3_incremental_trend_state),
+    (4, _migration_4_per_user_profile),
+]
+
+def get_schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+def migrate_database(conn):
+    """Bring the schema up to the latest version. Returns the resulting version."""
+    version = get_schema_version(conn)
+    for target, migration in SCHEMA_MIGRATIONS:
+        if target <= version:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
         try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS daily_logs (
-                    id INTEGER PRIMARY KEY,
-                    timestamp TEXT NOT NULL,
-                    session_id TEXT NOT NULL,
-                    transcript_summary TEXT,
-                    mood_score REAL,
-                    anxiety_score REAL,
-                    risk_level INTEGER,
-                    jitter_score REAL,
-                    loudness_mean REAL
-                )
-            ''')
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_profile (
-                    trait_key TEXT PRIMARY KEY,
-                    trait_value TEXT,
-                    last_updated TEXT
-                )
-            ''')
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {int(target)}")
             conn.commit()
-            print("Database setup complete: daily_logs and user_profile tables ready.")
-        except sqlite3.Error as e:
-            print(f"Error setting up database tables: {e}")
-        finally:
-            conn.close()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied database migration {target}: {migration.__name__}")
+        version = target
+    return version
+
+def setup_database():
+    try:
+        with get_pool().connection() as conn:
+            version = migrate_database(conn)
+        print(f"Database setup complete: schema version {version}.")
+    except sqlite3.Error as e:
+        print(f"Error setting up database tables: {e}")
+        return
+    # Startup is the natural point to run the retention job (off unless LOG_RETENTION_DAYS is set)
+    compact_old_logs()
+
+def compact_old_logs(retention_days=LOG_RETENTION_DAYS):
+    """Delete raw daily_logs rows older than `retention_days` (0 or None: keep
+    everything). Their per-day aggregates already live in daily_rollups
+    (maintained by save_daily_log), and the cutoff is aligned to local midnight
+    so no day is left half-compacted. Returns rows compacted.
+    """
+    if not retention_days or retention_days <= 0:
+        return 0
+    cutoff = int(_local_day_start(retention_days).timestamp())
+    try:
+        with get_pool().connection() as conn:
+            with conn:
+                deleted = conn.execute("DELETE FROM daily_logs WHERE ts_epoch < ?", (cutoff,)).rowcount
+        if deleted:
+            print(f"Compacted {deleted} daily log rows older than {retention_days} days.")
+        return deleted
+    except sqlite3.Error as e:
+        print(f"Error compacting daily logs: {e}")
+        return 0
+
+def get_write_version():
+    """Counter that changes whenever a log or profile trait is written."""
+    return _write_version
+
+def _bump_write_version():
+    global _write_version
+    with _write_version_lock:
+        _write_version += 1
 
 def save_daily_log(log_data):
-    conn = create_connection()
-    if conn is not None:
-        try:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO daily_logs (
-                    timestamp, session_id, transcript_summary, mood_score, anxiety_score, 
-                    risk_level, jitter_score, loudness_mean
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                log_data.get('timestamp'), log_data.get('session_id'), 
-                log_data.get('transcript_summary'), log_data.get('mood_score'), 
-                log_data.get('anxiety_score'), log_data.get('risk_level'), 
-                log_data.get('jitter_score'), log_data.get('loudness_mean')
-            ))
-            conn.commit()
-            print(f"Daily Log saved for session {log_data.get('session_id')}.")
-        except sqlite3.Error as e:
-            print(f"Error saving daily log: {e}")
-        finally:
-            conn.close()
+    timestamp = log_data.get('timestamp') or datetime.datetime.now().isoformat()
+    ts_epoch = _to_epoch(timestamp)
+    if ts_epoch is None:
+        ts_epoch = int(time.time())
+    user_id = log_data.get('user_id') or DEFAULT_USER_ID
+    # A score that isn't a number is stored as NULL rather than losing the row
+    mood = _to_score(log_data.get('mood_score'))
+    anxiety = _to_score(log_data.get('anxiety_score'))
+    # Aggregates are updated in the same transaction as the raw row, so trend
+    # checks can read them without rescanning daily_logs
+    aggregate_params = {
+        'user_id': user_id,
+        'day': datetime.datetime.fromtimestamp(ts_epoch).date().isoformat(),
+        'ts_epoch': ts_epoch,
+        'mood': mood,
+        'anxiety': anxiety,
+        'risk': log_data.get('risk_level'),
+        'is_low': None if mood is None else int(mood < LOW_MOOD_THRESHOLD),
+    }
+    try:
+        with get_pool().connection() as conn:
+            with conn:
+                conn.execute(_INSERT_LOG_SQL, (
+                    timestamp, log_data.get('session_id'), 
+                    log_data.get('transcript_summary'), mood, 
+                    anxiety, log_data.get('risk_level'), 
+                    log_data.get('jitter_score'), log_data.get('loudness_mean'),
+                    ts_epoch, user_id
+                ))
+                conn.execute(_UPSERT_ROLLUP_SQL, aggregate_params)
+                conn.execute(_UPSERT_TREND_SQL, aggregate_params)
+        _bump_write_version()
+        print(f"Daily Log saved for session {log_data.get('session_id')}.")
+    except sqlite3.Error as e:
+        print(f"Error saving daily log: {e}")
 
-def update_user_profile(trait_key, trait_value):
-    conn = create_connection()
-    if conn is not None:
-        try:
-            cursor = conn.cursor()
-            timestamp = datetime.datetime.now().isoformat()
-            cursor.execute('''
-                REPLACE INTO user_profile (trait_key, trait_value, last_updated)
-                VALUES (?, ?, ?)
-            ''', (trait_key, trait_value, timestamp))
-            conn.commit()
-            print(f"User Profile updated for key: {trait_key}.")
-        except sqlite3.Error as e:
-            print(f"Error updating user profile: {e}")
-        finally:
-            conn.close()
+def update_user_profile(trait_key, trait_value, user_id=DEFAULT_USER_ID):
+    try:
+        with get_pool().connection() as conn:
+            with conn:
+                timestamp = datetime.datetime.now().isoformat()
+                conn.execute(_REPLACE_TRAIT_SQL, (user_id, trait_key, trait_value, timestamp))
+        _bump_write_version()
+        print(f"User Profile updated for key: {trait_key}.")
+    except sqlite3.Error as e:
+        print(f"Error updating user profile: {e}")
 
-def get_recent_history(days=7):
-    conn = create_connection()
+def get_recent_history(days=7, user_id=DEFAULT_USER_ID, limit=None):
+    """Newest-first log rows from the last `days` days, served from the
+    (user_id, ts_epoch) index. `limit` caps the number of rows returned."""
     logs = []
-    if conn is not None:
-        try:
-            cutoff = datetime.datetime.now() - datetime.timedelta(days=days)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM daily_logs 
-                WHERE timestamp >= ? 
-                ORDER BY timestamp DESC
-            ''', (cutoff.isoformat(),))
-            logs = cursor.fetchall()
-        except sqlite3.Error as e:
-            print(f"Error retrieving history: {e}")
-        finally:
-            conn.close()
+    try:
+        cutoff = int(time.time() - days * 86400)
+        with get_pool().connection() as conn:
+            logs = conn.execute(_RECENT_HISTORY_SQL, (user_id, cutoff, -1 if limit is None else limit)).fetchall()
+    except sqlite3.Error as e:
+        print(f"Error retrieving history: {e}")
     return logs
 
-def get_user_profile():
-    conn = create_connection()
+def get_user_profile(user_id=DEFAULT_USER_ID):
     profile = {}
-    if conn is not None:
-        try:
-            cursor = conn.cursor()
-            cursor.execute('SELECT trait_key, trait_value FROM user_profile')
-            profile = {row[0]: row[1] for row in cursor.fetchall()}
-        except sqlite3.Error as e:
-            print(f"Error retrieving profile: {e}")
-        finally:
-            conn.close()
-    return profile
\ No newline at end of file
+    try:
+        with get_pool().connection() as conn:
+            profile = {row[0]: row[1] for row in conn.execute(_PROFILE_SQL, (user_id,)).fetchall()}
+    except sqlite3.Error as e:
+        print(f"Error retrieving profile: {e}")
+    return profile
+
+def get_profile_traits(user_id=DEFAULT_USER_ID, limit=None):
+    """(trait_key, trait_value, last_updated) rows, most recently updated first."""
+    traits = []
+    try:
+        with get_pool().connection() as conn:
+            traits = conn.execute(_PROFILE_TRAITS_SQL, (user_id, -1 if limit is None else limit)).fetchall()
+    except sqlite3.Error as e:
+        print(f"Error retrieving profile traits: {e}")
+    return traits
+
+def get_daily_rollups(days=None, user_id=DEFAULT_USER_ID):
+    """Per-day aggregates from daily_rollups, newest first, as dicts."""
+    rollups = []
+    try:
+        since = _local_day_start(days).date().isoformat() if days is not None else ''
+        with get_pool().connection() as conn:
+            rows = conn.execute(_ROLLUP_SQL, (user_id, since)).fetchall()
+        for day, entries, mood_sum, mood_count, mood_min, mood_max, anxiety_sum, anxiety_count, risk_max in rows:
+            rollups.append({
+                'day': day,
+                'entries': entries,
+                'mood_avg': mood_sum / mood_count if mood_count else None,
+                'mood_min': mood_min,
+                'mood_max': mood_max,
+                'anxiety_avg': anxiety_sum / anxiety_count if anxiety_count else None,
+                'risk_max': risk_max,
+            })
+    except sqlite3.Error as e:
+        print(f"Error retrieving daily rollups: {e}")
+    return rollups
+
+def get_trend_snapshot(days=7, user_id=DEFAULT_USER_ID):
+    """O(1) trend summary for the guardian over the last `days` calendar days
+    (at most `days` rollup rows): entry count, anxiety totals and the current
+    low-mood streak, counting only the run's entries inside the same window.
+    """
+    snapshot = {'entries': 0, 'anxiety_sum': 0.0, 'anxiety_count': 0, 'low_mood_streak': 0}
+    try:
+        window = _local_day_start(days - 1)
+        since = window.date().isoformat()
+        with get_pool().connection() as conn:
+            entries, anxiety_sum, anxiety_count = conn.execute(_TREND_TOTALS_SQL, (user_id, since)).fetchone()
+            state = conn.execute(_TREND_STATE_SQL, (user_id,)).fetchone()
+            if state is not None and state[0] is not None:
+                window_start = max(state[0], int(window.timestamp()))
+                snapshot['low_mood_streak'] = conn.execute(
+                    _LOW_RUN_IN_WINDOW_SQL, (user_id, window_start, LOW_MOOD_THRESHOLD)
+                ).fetchone()[0]
+        snapshot.update(entries=entries, anxiety_sum=anxiety_sum, anxiety_count=anxiety_count)
+    except sqlite3.Error as e:
+        print(f"Error retrieving trend snapshot: {e}")
+    return snapshot
@@ -0,0 +1,119 @@
+# tools/startup.py
+"""
+Startup helpers: background prewarming of the heavy dependencies, and an
+import-time profiler for `python main.py --profile-startup`.
+
+Nothing heavy is imported at module level anywhere in the app: google.genai
+loads when the shared client makes its first call, Whisper/torch when the STT
+model is first needed, openSMILE with the first biomarker extraction and
+sounddevice when recording starts. prewarm() pays those costs on a daemon
+thread while the user is still reading the greeting or speaking.
+"""
+import os
+import re
+import subprocess
+import sys
+import threading
+import time
+
+PREWARM_ENABLED = os.getenv("PREWARM", "1").strip().lower() not in {"0", "false", "no"}
+
+_prewarm_thread = None
+_prewarm_lock = threading.Lock()
+prewarm_timings = {}
+
+
+def _timed(name, fn):
+    start = time.perf_counter()
+    try:
+        fn()
+    except Exception as e:
+        print(f"Prewarm of {name} failed (it will load on first use): {e}")
+    prewarm_timings[name] = time.perf_counter() - start
+
+
+def _warm_genai():
+    from tools.genai_client import get_genai_client
+
+    client = get_genai_client()
+    if client is not None:
+        client.raw  # builds the underlying client (imports google.genai)
+
+
+def _warm_stt():
+    from tools import stt_tts_tools
+
+    stt_tts_tools.initialize_stt_model()
+
+
+def _warm_biomarkers():
+    from tools import audio_tools
+
+    audio_tools.get_biomarker_extractor()
+
+
+def prewarm(genai=True, stt=True, biomarkers=True, background=True):
+    """
+    Load the heavy dependencies ahead of first use. Runs once per process;
+    later calls return the existing thread. With background=False it blocks.
+    """
+    global _prewarm_thread
+    if not PREWARM_ENABLED:
+        return None
+
+    def run():
+        # In the order a turn needs them: transcription, then reply, then analysis
+        if stt:
+            _timed("whisper", _warm_stt)
+        if genai:
+            _timed("genai", _warm_genai)
+        if biomarkers:
+            _timed("opensmile", _warm_biomarkers)
+
+    with _prewarm_lock:
+        if _prewarm_thread is not None:
+            return _prewarm_thread
+        _prewarm_thread = threading.Thread(target=run, name="prewarm", daemon=True)
+        _prewarm_thread.start()
+    if not background:
+        _prewarm_thread.join()
+    return _prewarm_thread
+
+
+# ----------------------------------------------------------------
+# IMPORT-TIME PROFILING
+# ----------------------------------------------------------------
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def profile_imports(modules, top=25):
+    """
+    Import `modules` in a fresh interpreter with -X importtime and return
+    (total_seconds, [(module, self_s, cumulative_s), ...]) for the `top`
+    slowest modules by cumulative time.
+    """
+    code = "; ".join(f"import {m}" for m in modules)
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    total = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _indent, name = match.groups()
+            rows.append((name, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    rows.sort(key=lambda r: r[2], reverse=True)
+    return total, rows[:top]
+
+
+def print_import_profile(modules, top=25):
+    total, rows = profile_imports(modules, top)
+    print(f"Cold import of {', '.join(modules)}: {total:.2f}s (interpreter start included)")
+    print(f"{'module':<50} {'self (s)':>10} {'cumulative (s)':>15}")
+    for name, self_s, cumulative_s in rows:
+        print(f"{name:<50} {self_s:>10.3f} {cumulative_s:>15.3f}")
@@ -0,0 +1,109 @@
+import queue
+import threading
+
+import numpy as np
+
+from tools import stt_tts_tools
+from tools.audio_buffers import RingBuffer
+from tools.vad import EnergySegmenter
+
+SAMPLE_RATE = 16000
+_END = object()
+
+
+class StreamingTranscriber:
+    """
+    Transcribe speech while it is still being recorded.
+
+    feed() is safe to call from the sounddevice callback: it only copies the
+    frames into a ring buffer. A segmenter thread cuts the stream at pauses and
+    a worker thread runs Whisper on each segment, publishing partial transcripts
+    in order. finish() flushes the tail and returns the stitched transcript.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, transcribe_fn=None, ring_seconds=30, segmenter=None):
+        self.sample_rate = sample_rate
+        self.ring = RingBuffer(int(ring_seconds * sample_rate))
+        self.segmenter = segmenter or EnergySegmenter(sample_rate)
+        self._transcribe = transcribe_fn or stt_tts_tools.transcribe_audio
+        self._segments = queue.Queue()
+        self._partials = queue.Queue()
+        self._texts = []
+        self._done = False
+        self._segment_thread = threading.Thread(target=self._segment_loop, daemon=True)
+        self._stt_thread = threading.Thread(target=self._transcribe_loop, daemon=True)
+
+    def start(self):
+        self._segment_thread.start()
+        self._stt_thread.start()
+        return self
+
+    def feed(self, indata) -> None:
+        # indata is (frames, channels); keep the first channel only
+        samples = indata[:, 0] if getattr(indata, "ndim", 1) > 1 else indata
+        self.ring.write(samples)
+
+    @property
+    def transcript(self) -> str:
+        return " ".join(self._texts).strip()
+
+    def partials(self, timeout=None):
+        """Yield partial transcripts as segments complete, until the stream ends."""
+        while not self._done:
+            try:
+                item = self._partials.get(timeout=timeout)
+            except queue.Empty:
+                return
+            if item is _END:
+                self._done = True
+                return
+            yield item
+
+    def poll_partials(self):
+        """Non-blocking variant of partials(): yield only what is ready now."""
+        while not self._done:
+            try:
+                item = self._partials.get_nowait()
+            except queue.Empty:
+                return
+            if item is _END:
+                self._done = True
+                return
+            yield item
+
+    def finish(self, timeout=None) -> str:
+        self.ring.close()
+        self._segment_thread.join(timeout)
+        self._stt_thread.join(timeout)
+        if self.ring.overruns:
+            print(f"Streaming STT dropped {self.ring.overruns} samples (consumer fell behind).")
+        return self.transcript
+
+    def _segment_loop(self):
+        hop = self.segmenter.frame_length * 10
+        while True:
+            chunk = self.ring.read(max_samples=hop, timeout=0.1)
+            if chunk.size:
+                for segment in self.segmenter.process(chunk):
+                    self._segments.put(segment)
+            elif self.ring.closed and self.ring.available() == 0:
+                tail = self.segmenter.flush()
+                if tail is not None:
+                    self._segments.put(tail)
+                self._segments.put(_END)
+                return
+
+    def _transcribe_loop(self):
+        while True:
+            segment = self._segments.get()
+            if segment is _END:
+                self._partials.put(_END)
+                return
+            try:
+                text = self._transcribe(np.ascontiguousarray(segment, dtype=np.float32))
+            except Exception as e:
+                print(f"Streaming transcription error: {e}")
+                text = ""
+            if text:
+                self._texts.append(text)
+                self._partials.put(text)
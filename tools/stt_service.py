@@ -0,0 +1,236 @@
+# tools/stt_service.py
+"""
+Process-pool Whisper service for hosts that transcribe for many sessions at once.
+
+Each worker process keeps one resident model and runs torch with a fixed thread
+budget, so workers don't oversubscribe the CPU the way uncoordinated per-request
+transcribe_audio() calls do. Short clips that arrive within STT_BATCH_WINDOW_MS
+of each other are padded to Whisper's 30 s window and decoded as one batch.
+"""
+import concurrent.futures
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from tools import stt_tts_tools
+from tools.audio_clip import AudioClip
+from tools.tracing import _percentile
+
+_CPUS = os.cpu_count() or 1
+# 0 disables the service; callers then fall back to in-process transcription
+STT_SERVICE_WORKERS = int(os.getenv("STT_SERVICE_WORKERS", "0"))
+STT_TORCH_THREADS = int(os.getenv("STT_TORCH_THREADS", "0"))  # 0 = share the cores evenly
+STT_BATCH_WINDOW_MS = float(os.getenv("STT_BATCH_WINDOW_MS", "25"))
+STT_MAX_BATCH = int(os.getenv("STT_MAX_BATCH", "8"))
+STT_LANGUAGE = os.getenv("STT_LANGUAGE") or None
+
+WHISPER_WINDOW_SAMPLES = 30 * stt_tts_tools.WHISPER_SAMPLE_RATE
+
+
+# ----------------------------------------------------------------
+# WORKER PROCESS SIDE
+# ----------------------------------------------------------------
+_worker_model = None
+
+
+def _init_worker(model_size, device, torch_threads):
+    import torch
+
+    global _worker_model
+    torch.set_num_threads(torch_threads)
+    _worker_model = stt_tts_tools.initialize_stt_model(model_size, device)
+
+
+def _transcribe_batch(clips, language=None):
+    import torch
+    import whisper
+
+    model = _worker_model
+    fp16 = stt_tts_tools._compute_dtype(str(model.device)) == "fp16"
+    if len(clips) == 1 or any(len(c) > WHISPER_WINDOW_SAMPLES for c in clips):
+        # Long-form audio needs Whisper's sliding-window transcribe(); run one by one
+        return [model.transcribe(c, fp16=fp16, language=language).get("text", "").strip() for c in clips]
+
+    with torch.inference_mode():
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(c)), model.dims.n_mels)
+            for c in clips
+        ]).to(model.device)
+        options = whisper.DecodingOptions(language=language, fp16=fp16, without_timestamps=True)
+        results = whisper.decode(model, mels, options)
+    return [r.text.strip() for r in results]
+
+
+# ----------------------------------------------------------------
+# PARENT PROCESS SIDE
+# ----------------------------------------------------------------
+_SHUTDOWN = object()
+
+
+class _Request:
+    __slots__ = ("samples", "future", "enqueued_at")
+
+    def __init__(self, samples):
+        self.samples = samples
+        self.future = concurrent.futures.Future()
+        self.enqueued_at = time.monotonic()
+
+
+class STTService:
+    """Coalescing front-end for a pool of Whisper worker processes."""
+
+    def __init__(self, workers=None, batch_window_ms=STT_BATCH_WINDOW_MS, max_batch=STT_MAX_BATCH,
+                 model_size=None, device=None, torch_threads=None, language=STT_LANGUAGE):
+        self.workers = max(1, workers or STT_SERVICE_WORKERS or 1)
+        self.batch_window = batch_window_ms / 1000.0
+        self.max_batch = max(1, max_batch)
+        self.language = language
+        torch_threads = torch_threads or STT_TORCH_THREADS or max(1, _CPUS // self.workers)
+        # spawn, not fork: the parent runs threads (dispatcher, analysis worker, event loop)
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(model_size or stt_tts_tools.STT_MODEL_SIZE, device or stt_tts_tools.STT_DEVICE, torch_threads),
+        )
+        self._pending = queue.Queue()
+        # At most one batch queued per worker beyond the ones running, so new
+        # requests wait here (and get coalesced) instead of piling up in the pool
+        self._slots = threading.BoundedSemaphore(self.workers * 2)
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._batch_sizes = deque(maxlen=1000)
+        self._completed = 0
+        self._failed = 0
+        self._in_flight = 0
+        self._closed = False
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="stt-dispatcher", daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, audio) -> concurrent.futures.Future:
+        """Queue audio (AudioClip, 16 kHz float32 array or WAV path); returns a Future[str]."""
+        if self._closed:
+            raise RuntimeError("STTService is shut down")
+        if isinstance(audio, AudioClip):
+            samples = audio.resampled(stt_tts_tools.WHISPER_SAMPLE_RATE).samples
+        elif isinstance(audio, (str, os.PathLike)):
+            samples = AudioClip.from_file(str(audio)).resampled(stt_tts_tools.WHISPER_SAMPLE_RATE).samples
+        else:
+            samples = np.asarray(audio, dtype=np.float32)
+        request = _Request(np.ascontiguousarray(samples, dtype=np.float32))
+        self._pending.put(request)
+        return request.future
+
+    def transcribe(self, audio, timeout=None) -> str:
+        return self.submit(audio).result(timeout)
+
+    def _dispatch_loop(self):
+        carry = None
+        while True:
+            first = carry if carry is not None else self._pending.get()
+            carry = None
+            if first is _SHUTDOWN:
+                self._fail_pending()
+                return
+            batch = [first]
+            if len(first.samples) <= WHISPER_WINDOW_SAMPLES:
+                deadline = time.monotonic() + self.batch_window
+                while len(batch) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        request = self._pending.get(timeout=remaining)
+                    except queue.Empty:
+                        break
+                    if request is _SHUTDOWN or len(request.samples) > WHISPER_WINDOW_SAMPLES:
+                        carry = request  # long clip or shutdown: dispatch after this batch
+                        break
+                    batch.append(request)
+            self._slots.acquire()
+            with self._stats_lock:
+                self._in_flight += len(batch)
+                self._batch_sizes.append(len(batch))
+            try:
+                future = self._pool.submit(_transcribe_batch, [r.samples for r in batch], self.language)
+            except Exception as e:
+                # A dead worker breaks the pool (BrokenProcessPool); fail this batch, keep dispatching
+                self._complete(batch, None, e)
+                continue
+            future.add_done_callback(lambda f, batch=batch: self._complete(batch, f))
+
+    def _complete(self, batch, future, error=None):
+        self._slots.release()
+        now = time.monotonic()
+        if error is None:
+            error = future.exception()
+        with self._stats_lock:
+            self._in_flight -= len(batch)
+            if error is None:
+                self._completed += len(batch)
+                self._latencies.extend(now - r.enqueued_at for r in batch)
+            else:
+                self._failed += len(batch)
+        if error is not None:
+            for request in batch:
+                request.future.set_exception(error)
+            return
+        for request, text in zip(batch, future.result()):
+            request.future.set_result(text)
+
+    def metrics(self) -> dict:
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            batch_sizes = list(self._batch_sizes)
+            return {
+                "workers": self.workers,
+                "queue_depth": self._pending.qsize(),
+                "in_flight": self._in_flight,
+                "completed": self._completed,
+                "failed": self._failed,
+                "avg_batch_size": (sum(batch_sizes) / len(batch_sizes)) if batch_sizes else None,
+                "latency_p50_s": _percentile(latencies, 0.50),
+                "latency_p95_s": _percentile(latencies, 0.95),
+                "latency_p99_s": _percentile(latencies, 0.99),
+            }
+
+    def _fail_pending(self):
+        """Fail requests still queued once the dispatcher has stopped."""
+        while True:
+            try:
+                request = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            if request is not _SHUTDOWN:
+                request.future.set_exception(RuntimeError("STTService is shut down"))
+
+    def shutdown(self, wait=True):
+        if self._closed:
+            return
+        self._closed = True
+        self._pending.put(_SHUTDOWN)
+        if wait:
+            self._dispatcher.join()
+            self._fail_pending()
+        self._pool.shutdown(wait=wait)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_stt_service():
+    """Shared STTService, or None when STT_SERVICE_WORKERS is 0."""
+    global _service
+    if STT_SERVICE_WORKERS <= 0:
+        return None
+    with _service_lock:
+        if _service is None:
+            _service = STTService()
+        return _service
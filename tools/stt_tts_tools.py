@@ -1,53 +1,374 @@
 # tools/stt_tts_tools.py
 
+import hashlib
+import json
 import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
 from pathlib import Path
 
-# Directory for temporary audio output
-TTS_OUTPUT_DIR = Path("data/temp_audio")
-TTS_OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+from tools.tts_backends import get_tts_backend, get_fallback_backend
 
-TTS_OUTPUT_PATH = TTS_OUTPUT_DIR / "ai_response.mp3"
+# Content-addressed TTS cache: identical (text, lang, engine, voice) -> same file
+TTS_CACHE_DIR = Path(os.getenv("TTS_CACHE_DIR", "data/tts_cache"))
+TTS_CACHE_MAX_BYTES = int(float(os.getenv("TTS_CACHE_MAX_MB", "200")) * 1024 * 1024)
+TTS_LANG = "en"
+# After the primary engine fails, go straight to the fallback for this long
+TTS_FAILURE_COOLDOWN = float(os.getenv("TTS_FAILURE_COOLDOWN", "60"))
+
+_tts_cache_lock = threading.Lock()
+_tts_cache_bytes = None  # running size estimate; None until the first scan
+_tts_failures = {}  # backend name -> time.monotonic() of its last failure
+
+# Whisper configuration (overridable via environment)
+STT_MODEL_SIZE = os.getenv("STT_MODEL_SIZE", "base")   # or "tiny", "small", etc.
+STT_DEVICE = os.getenv("STT_DEVICE", "cpu")
+STT_MAX_CACHED_MODELS = int(os.getenv("STT_MAX_CACHED_MODELS", "2"))
+WHISPER_SAMPLE_RATE = 16000
+
+# Process-wide model registry: (size, device, dtype) -> model, in LRU order
+_STT_MODELS = OrderedDict()
+_STT_MODELS_LOCK = threading.Lock()
 
 
 # ----------------------------------------------------------------
 # TEXT TO SPEECH
 # ----------------------------------------------------------------
-def speak_text(text: str) -> str:
+def _active_tts_backend():
+    """The configured backend, or the fallback while the configured one is
+    cooling down after a failure (so cache lookups use the voice that will
+    actually be synthesized)."""
+    backend = get_tts_backend()
+    failed_at = _tts_failures.get(backend.name)
+    if failed_at is not None and time.monotonic() - failed_at < TTS_FAILURE_COOLDOWN:
+        fallback = get_fallback_backend()
+        if fallback is not None:
+            return fallback
+    return backend
+
+
+def synthesize_speech(text: str, lang: str = TTS_LANG, backend=None):
+    """
+    Synthesize `text` entirely in memory with the configured backend (see
+    tools/tts_backends.py), falling back to TTS_FALLBACK_BACKEND if it fails.
+    A failed backend is skipped for TTS_FAILURE_COOLDOWN seconds.
+    Returns (audio_bytes, backend_used); backend_used.audio_format tells the
+    encoding ("mp3" for gTTS, "wav" for the offline engines).
+    """
+    backend = backend or _active_tts_backend()
+    try:
+        audio = backend.synthesize(text, lang)
+    except Exception as e:
+        fallback = get_fallback_backend()
+        if fallback is None or fallback is backend:
+            raise
+        _tts_failures[backend.name] = time.monotonic()
+        print(f"TTS backend {backend.name!r} failed ({e}); using {fallback.name!r}")
+        return fallback.synthesize(text, lang), fallback
+    _tts_failures.pop(backend.name, None)
+    return audio, backend
+
+
+def tts_cache_key(text: str, lang: str = TTS_LANG, engine: str = None, voice: str = None) -> str:
+    if engine is None or voice is None:
+        backend = get_tts_backend(engine)
+        engine, voice = backend.name, backend.voice if voice is None else voice
+    payload = json.dumps([engine, voice, lang, text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _tts_cache_path(text: str, lang: str, backend):
+    key = tts_cache_key(text, lang, backend.name, backend.voice)
+    return TTS_CACHE_DIR / key[:2] / f"{key}.{backend.audio_format}"
+
+
+def _scan_tts_cache():
+    entries = []
+    if TTS_CACHE_DIR.exists():
+        for path in TTS_CACHE_DIR.glob("*/*"):
+            if path.name.startswith("."):
+                continue  # in-flight temp file
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    return entries
+
+
+def _enforce_tts_cache_limit(added_bytes: int):
+    """Evict least-recently-used entries (by mtime, refreshed on every hit)
+    once the cache grows past TTS_CACHE_MAX_BYTES; trims down to 90%."""
+    global _tts_cache_bytes
+    with _tts_cache_lock:
+        if _tts_cache_bytes is None:
+            _tts_cache_bytes = sum(size for _, size, _ in _scan_tts_cache())
+        else:
+            _tts_cache_bytes += added_bytes
+        if _tts_cache_bytes <= TTS_CACHE_MAX_BYTES:
+            return
+        entries = sorted(_scan_tts_cache())
+        total = sum(size for _, size, _ in entries)
+        target = int(TTS_CACHE_MAX_BYTES * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except OSError:
+                pass
+        _tts_cache_bytes = total
+
+
+def _mime_type(audio_format: str) -> str:
+    return "audio/mpeg" if audio_format == "mp3" else f"audio/{audio_format}"
+
+
+def _touch_cached(path: Path) -> bool:
+    """True if `path` is in the TTS cache, marking it recently used for LRU eviction."""
+    try:
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+
+def _write_tts_cache(path: Path, audio: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a unique temp name and rename, so readers never see a partial file
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    _enforce_tts_cache_limit(len(audio))
+
+
+def speak_text(text: str, output_path=None, lang: str = TTS_LANG) -> str:
     """
     TTS that writes directly to a file. No PortAudio / device I/O.
-    gTTS works fine on Streamlit Cloud.
+    The engine is chosen by TTS_BACKEND (gTTS by default, or an offline one).
+
+    Without output_path, audio comes from a content-addressed cache keyed by
+    (text, lang, engine, voice): repeated phrases return instantly, and every
+    distinct text gets its own file, so concurrent callers never clobber each other.
     """
-    from gtts import gTTS
+    if output_path is not None:
+        audio, _ = synthesize_speech(text, lang)
+        with open(output_path, "wb") as f:
+            f.write(audio)
+        return str(output_path)
+
+    backend = _active_tts_backend()
+    path = _tts_cache_path(text, lang, backend)
+    if _touch_cached(path):
+        return str(path)
+
+    audio, used = synthesize_speech(text, lang, backend)
+    if used is not backend:
+        path = _tts_cache_path(text, lang, used)
+    _write_tts_cache(path, audio)
+    return str(path)
+
+
+def speak_text_bytes(text: str, lang: str = TTS_LANG, cache: bool = True):
+    """Like speak_text, but returns (audio_bytes, mime_type) for in-memory playback.
+    Fresh audio is returned as synthesized; the cache file is written on the side.
+    Pass cache=False for one-off text (e.g. a model reply) so it stays in memory
+    and doesn't push repeatable phrases out of the cache."""
+    backend = _active_tts_backend()
+    path = _tts_cache_path(text, lang, backend)
+    if _touch_cached(path):
+        try:
+            return path.read_bytes(), _mime_type(backend.audio_format)
+        except OSError:
+            pass  # evicted in between; synthesize again
+
+    audio, used = synthesize_speech(text, lang, backend)
+    if cache:
+        _write_tts_cache(_tts_cache_path(text, lang, used), audio)
+    return audio, _mime_type(used.audio_format)
+
 
-    tts = gTTS(text=text, lang="en")
-    tts.save(str(TTS_OUTPUT_PATH))
-    return str(TTS_OUTPUT_PATH)
+def prerender_phrases(phrases, lang: str = TTS_LANG, background: bool = True):
+    """Warm the TTS cache for fixed phrases so they play instantly later."""
+    def render():
+        for phrase in phrases:
+            try:
+                speak_text(phrase, lang=lang)
+            except Exception as e:
+                print(f"TTS pre-render failed for {phrase[:30]!r}: {e}")
+
+    if not background:
+        render()
+        return None
+    thread = threading.Thread(target=render, name="tts-prerender", daemon=True)
+    thread.start()
+    return thread
+
+
+# Sentence boundary: terminal punctuation, optional closing quotes/brackets, then whitespace
+_SENTENCE_END = re.compile(r"[.!?\u2026]+[\"'\u201d\u2019)\]]*\s+")
+
+
+def iter_sentences(chunks, min_chars: int = 20):
+    """
+    Re-chunk a stream of text fragments (e.g. LLM tokens) into sentences.
+    Very short sentences are merged with the next one so TTS isn't called for
+    fragments like "Oh." on their own.
+    """
+    buffer = ""
+    pending = ""
+    for chunk in chunks:
+        buffer += chunk
+        while True:
+            match = _SENTENCE_END.search(buffer)
+            if not match:
+                break
+            sentence = (pending + buffer[:match.end()]).strip()
+            buffer = buffer[match.end():]
+            if len(sentence) < min_chars:
+                pending = sentence + " "
+                continue
+            pending = ""
+            yield sentence
+    tail = (pending + buffer).strip()
+    if tail:
+        yield tail
+
+
+def speak_text_stream(sentences):
+    """
+    Synthesize sentences as they arrive and yield (sentence, audio_bytes, mime_type)
+    in order. The sentence source (typically a streaming LLM reply) is drained on a
+    separate thread, so generation keeps going while each sentence is being
+    synthesized, and the first audio is ready after the first sentence.
+    Reply sentences are one-offs, so their audio is kept in memory, not cached.
+    """
+    pending = queue.Queue()
+    done = object()
+
+    def reader():
+        try:
+            for sentence in sentences:
+                pending.put(sentence)
+        except Exception as e:
+            pending.put(e)
+        finally:
+            pending.put(done)
+
+    threading.Thread(target=reader, daemon=True).start()
+    while True:
+        item = pending.get()
+        if item is done:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield (item, *speak_text_bytes(item, cache=False))
 
 
 # ----------------------------------------------------------------
-# SPEECH TO TEXT (FILE ONLY)
-# works on cloud because it reads WAV file, not microphone.
+# WHISPER MODEL REGISTRY
 # ----------------------------------------------------------------
-def transcribe_audio(path: str) -> str:
+def _compute_dtype(device: str) -> str:
+    # Whisper only supports fp16 on CUDA; CPU inference always runs fp32
+    return "fp16" if device.startswith("cuda") else "fp32"
+
+
+def get_stt_model(model_size: str = None, device: str = None):
     """
-    Run STT on a WAV file only. Does not use mic hardware.
-    Modify this to your actual STT implementation.
+    Return a loaded Whisper model from the process-wide registry, loading it
+    on first use. Least-recently-used models are evicted once more than
+    STT_MAX_CACHED_MODELS distinct configurations are resident.
     """
-    import whisper
+    model_size = model_size or STT_MODEL_SIZE
+    device = device or STT_DEVICE
+    key = (model_size, device, _compute_dtype(device))
 
-    model = whisper.load_model("base")   # or "tiny", "small", etc.
-    result = model.transcribe(path)
+    with _STT_MODELS_LOCK:
+        model = _STT_MODELS.get(key)
+        if model is not None:
+            _STT_MODELS.move_to_end(key)
+            return model
+
+        import whisper
+
+        model = whisper.load_model(model_size, device=device)
+        # Decoding installs kv-cache hooks on the shared modules, so concurrent
+        # transcribe() calls on one model corrupt each other; see _decode()
+        model._serenai_lock = threading.Lock()
+        _STT_MODELS[key] = model
+        while len(_STT_MODELS) > max(STT_MAX_CACHED_MODELS, 1):
+            evicted_key, _ = _STT_MODELS.popitem(last=False)
+            print(f"Evicted Whisper model from cache: {evicted_key}")
+        return model
+
+
+def _decode(model, audio, **options):
+    """model.transcribe(), one call at a time per model."""
+    with model._serenai_lock:
+        return model.transcribe(audio, **options)
+
+
+def clear_stt_models():
+    """Drop every cached Whisper model (e.g. to free memory)."""
+    with _STT_MODELS_LOCK:
+        _STT_MODELS.clear()
+
+
+# ----------------------------------------------------------------
+# SPEECH TO TEXT (FILE OR IN-MEMORY AUDIO)
+# works on cloud because it never touches the microphone.
+# ----------------------------------------------------------------
+def transcribe_audio(path, model_size: str = None) -> str:
+    """
+    Run STT on a WAV file, an AudioClip (decoded straight from memory) or a
+    16 kHz float32 NumPy array. Does not use mic hardware.
+    The model comes from the shared registry, so only decoding happens per call.
+    """
+    from tools.audio_clip import AudioClip
+
+    if isinstance(path, AudioClip):
+        # Whisper expects 16 kHz mono float32
+        path = path.resampled(WHISPER_SAMPLE_RATE).samples
+    device = STT_DEVICE
+    model = get_stt_model(model_size, device)
+    result = _decode(model, path, fp16=_compute_dtype(device) == "fp16")
     text = result.get("text", "")
     return text.strip()
 
 
 # ----------------------------------------------------------------
-# Optional initialization hook (empty but keeps code compatible)
+# Optional initialization hook
 # ----------------------------------------------------------------
-def initialize_stt_model():
+def initialize_stt_model(model_size: str = None, device: str = None):
     """
-    No hardware to initialize in cloud deployments.
-    This function stays for API compatibility.
+    Load the Whisper model into the shared registry and warm it up with a
+    short silent decode, so the first real utterance pays decode time only.
+    Safe to call repeatedly; subsequent calls are cache hits.
     """
-    pass
+    import numpy as np
+
+    device = device or STT_DEVICE
+    model = get_stt_model(model_size, device)
+    if getattr(model, "_serenai_warmed", False):
+        return model
+    try:
+        _decode(
+            model,
+            np.zeros(WHISPER_SAMPLE_RATE, dtype=np.float32),
+            fp16=_compute_dtype(device) == "fp16",
+            language="en",
+        )
+    except Exception as e:
+        print(f"STT warm-up failed (model still usable): {e}")
+    model._serenai_warmed = True
+    return model
@@ -0,0 +1,220 @@
+# tools/tracing.py
+"""
+Lightweight per-turn tracing.
+
+    with tracing.span("turn", session_id=sid):
+        with tracing.span("transcribe") as s:
+            text = transcribe_audio(clip)
+            s.set("chars", len(text))
+
+Spans nest through a contextvar, so child spans (including ones opened in
+asyncio tasks or asyncio.to_thread workers) join the enclosing turn's trace
+and inherit its session_id. Every finished span feeds an in-process latency
+histogram per span name (latency_summary() gives count/mean/p50/p95/p99) and,
+unless TRACE_EXPORT_PATH is empty, is appended to a JSONL file in the
+OpenTelemetry span JSON layout (traceId, spanId, parentSpanId, start/end
+unix nanos, attributes), one span per line. The file is rotated once it
+reaches TRACE_EXPORT_MAX_MB, keeping TRACE_EXPORT_BACKUPS older files
+(spans.jsonl.1 is the most recent).
+"""
+import atexit
+import contextlib
+import contextvars
+import json
+import os
+import queue
+import secrets
+import threading
+import time
+from collections import deque
+
+TRACING_ENABLED = os.getenv("TRACING", "1").strip().lower() not in {"0", "false", "no"}
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH", "data/traces/spans.jsonl")
+TRACE_EXPORT_MAX_BYTES = int(float(os.getenv("TRACE_EXPORT_MAX_MB", "20")) * 1024 * 1024)
+TRACE_EXPORT_BACKUPS = int(os.getenv("TRACE_EXPORT_BACKUPS", "3"))
+TRACE_HISTOGRAM_SIZE = int(os.getenv("TRACE_HISTOGRAM_SIZE", "2048"))
+SERVICE_NAME = "serenai"
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start_ns", "end_ns",
+                 "_start", "duration", "error")
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent.span_id if parent else None
+        # Children carry the session id so a single span line is attributable on its own
+        self.attributes = {"session_id": parent.attributes["session_id"]} if parent and "session_id" in parent.attributes else {}
+        self.attributes.update({k: v for k, v in (attributes or {}).items() if v is not None})
+        self.start_ns = time.time_ns()
+        self._start = time.perf_counter()
+        self.end_ns = None
+        self.duration = None
+        self.error = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def to_otel(self) -> dict:
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": k, "value": _otel_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+            "resource": {"service.name": SERVICE_NAME},
+        }
+
+
+def _otel_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Tracer:
+    """Collects finished spans into per-name histograms and an optional JSONL export."""
+
+    def __init__(self, export_path=TRACE_EXPORT_PATH, histogram_size=TRACE_HISTOGRAM_SIZE, enabled=TRACING_ENABLED):
+        self.enabled = enabled
+        self.export_path = export_path or None
+        self.histogram_size = histogram_size
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._export_queue = None
+        self._writer = None
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.duration = time.perf_counter() - span._start
+            span.end_ns = span.start_ns + int(span.duration * 1e9)
+            self.record(span)
+
+    def record(self, span):
+        with self._lock:
+            histogram = self._histograms.get(span.name)
+            if histogram is None:
+                histogram = self._histograms[span.name] = deque(maxlen=self.histogram_size)
+            histogram.append(span.duration)
+        if self.export_path:
+            self._export(span)
+
+    def _export(self, span):
+        # Spans are written by one background thread so the hot path never touches the disk
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None:
+                    self._export_queue = queue.Queue()
+                    self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+                    self._writer.start()
+                    atexit.register(self.flush)
+        self._export_queue.put(span.to_otel())
+
+    def _write_loop(self):
+        os.makedirs(os.path.dirname(self.export_path) or ".", exist_ok=True)
+        while True:
+            record = self._export_queue.get()
+            try:
+                lines = [record]
+                while True:
+                    try:
+                        lines.append(self._export_queue.get_nowait())
+                    except queue.Empty:
+                        break
+                self._rotate_if_full()
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.writelines(json.dumps(line) + "\n" for line in lines)
+            except OSError as e:
+                print(f"Trace export failed: {e}")
+            finally:
+                for _ in lines:
+                    self._export_queue.task_done()
+
+    def _rotate_if_full(self):
+        try:
+            if os.path.getsize(self.export_path) < TRACE_EXPORT_MAX_BYTES:
+                return
+        except OSError:
+            return  # not created yet
+        if TRACE_EXPORT_BACKUPS <= 0:
+            os.remove(self.export_path)
+            return
+        for i in range(TRACE_EXPORT_BACKUPS - 1, 0, -1):
+            older = f"{self.export_path}.{i}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.export_path}.{i + 1}")
+        os.replace(self.export_path, f"{self.export_path}.1")
+
+    def flush(self):
+        """Block until every exported span has been written."""
+        if self._export_queue is not None:
+            self._export_queue.join()
+
+    def latency_summary(self) -> dict:
+        """{span name: {count, mean_s, p50_s, p95_s, p99_s}} over the recent window."""
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self._histograms.items()}
+        return {
+            name: {
+                "count": len(values),
+                "mean_s": sum(values) / len(values) if values else None,
+                "p50_s": _percentile(values, 0.50),
+                "p95_s": _percentile(values, 0.95),
+                "p99_s": _percentile(values, 0.99),
+            }
+            for name, values in snapshot.items()
+        }
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+
+class _NoopSpan:
+    def set(self, key, value):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+tracer = Tracer()
+
+
+def span(name, **attributes):
+    """Open a span on the shared tracer (a new trace if none is active)."""
+    return tracer.span(name, **attributes)
+
+
+def latency_summary():
+    return tracer.latency_summary()
@@ -0,0 +1,135 @@
+# tools/tts_backends.py
+
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+
+# Which engine speak_text uses: "gtts" (network), "espeak" or "pyttsx3" (offline)
+TTS_BACKEND = os.getenv("TTS_BACKEND", "gtts")
+# Engine to retry with when the primary one fails (e.g. gTTS timeouts); empty disables
+TTS_FALLBACK_BACKEND = os.getenv("TTS_FALLBACK_BACKEND", "")
+TTS_VOICE = os.getenv("TTS_VOICE", "")
+TTS_RATE = int(os.getenv("TTS_RATE", "165"))  # words per minute, offline engines only
+
+
+class TTSBackend(ABC):
+    """
+    A text-to-speech engine that returns encoded audio in memory.
+    `audio_format` is the file extension / mime subtype of the returned bytes,
+    and `voice` identifies the voice for cache keys.
+    """
+
+    name = "base"
+    audio_format = "wav"
+
+    def __init__(self, voice: str = ""):
+        self.voice = voice
+
+    @abstractmethod
+    def synthesize(self, text: str, lang: str = "en") -> bytes:
+        """Return `text` spoken in `lang` as encoded `audio_format` bytes."""
+
+
+class GTTSBackend(TTSBackend):
+    """Google Translate TTS (needs network). Returns MP3 bytes."""
+
+    name = "gtts"
+    audio_format = "mp3"
+
+    def __init__(self, voice: str = ""):
+        # gTTS accent is chosen by Google Translate top-level domain
+        super().__init__(voice or "com")
+
+    def synthesize(self, text: str, lang: str = "en") -> bytes:
+        from gtts import gTTS
+
+        buf = io.BytesIO()
+        gTTS(text=text, lang=lang, tld=self.voice).write_to_fp(buf)
+        return buf.getvalue()
+
+
+class EspeakBackend(TTSBackend):
+    """Local espeak-ng / espeak binary. Returns WAV bytes straight from stdout."""
+
+    name = "espeak"
+    audio_format = "wav"
+
+    def __init__(self, voice: str = "", rate: int = TTS_RATE):
+        super().__init__(voice)
+        self.rate = rate
+        self.executable = shutil.which("espeak-ng") or shutil.which("espeak")
+
+    def synthesize(self, text: str, lang: str = "en") -> bytes:
+        if self.executable is None:
+            raise RuntimeError("espeak-ng/espeak is not installed")
+        result = subprocess.run(
+            [self.executable, "-v", self.voice or lang, "-s", str(self.rate), "--stdout", text],
+            capture_output=True, check=True, timeout=30,
+        )
+        return result.stdout
+
+
+class Pyttsx3Backend(TTSBackend):
+    """pyttsx3 (SAPI5 / NSSpeechSynthesizer / espeak driver). Returns WAV bytes."""
+
+    name = "pyttsx3"
+    audio_format = "wav"
+
+    def __init__(self, voice: str = "", rate: int = TTS_RATE):
+        super().__init__(voice)
+        self.rate = rate
+        self._engine = None
+        # The pyttsx3 engine is not thread-safe
+        self._lock = threading.Lock()
+
+    def synthesize(self, text: str, lang: str = "en") -> bytes:
+        with self._lock:
+            if self._engine is None:
+                import pyttsx3
+
+                self._engine = pyttsx3.init()
+                self._engine.setProperty("rate", self.rate)
+                if self.voice:
+                    self._engine.setProperty("voice", self.voice)
+            # pyttsx3 can only render to a file; keep it private and short-lived
+            fd, tmp_path = tempfile.mkstemp(suffix=".wav")
+            os.close(fd)
+            try:
+                self._engine.save_to_file(text, tmp_path)
+                self._engine.runAndWait()
+                with open(tmp_path, "rb") as f:
+                    return f.read()
+            finally:
+                os.unlink(tmp_path)
+
+
+TTS_BACKENDS = {
+    GTTSBackend.name: GTTSBackend,
+    EspeakBackend.name: EspeakBackend,
+    Pyttsx3Backend.name: Pyttsx3Backend,
+}
+
+_instances = {}
+_instances_lock = threading.Lock()
+
+
+def get_tts_backend(name: str = None) -> TTSBackend:
+    """Return the shared backend instance for `name` (default: TTS_BACKEND)."""
+    name = (name or TTS_BACKEND).strip().lower()
+    if name not in TTS_BACKENDS:
+        raise ValueError(f"Unknown TTS backend {name!r}; choose from {sorted(TTS_BACKENDS)}")
+    with _instances_lock:
+        backend = _instances.get(name)
+        if backend is None:
+            backend = _instances[name] = TTS_BACKENDS[name](voice=TTS_VOICE)
+        return backend
+
+
+def get_fallback_backend():
+    if not TTS_FALLBACK_BACKEND:
+        return None
+    return get_tts_backend(TTS_FALLBACK_BACKEND)
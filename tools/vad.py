@@ -0,0 +1,204 @@
+from collections import deque
+
+import numpy as np
+
+
+def frame_rms(samples: np.ndarray, frame_length: int) -> np.ndarray:
+    """RMS energy of each complete frame of `samples` (trailing partial frame is ignored)."""
+    n_frames = len(samples) // frame_length
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:n_frames * frame_length].reshape(n_frames, frame_length)
+    return np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+
+
+class EnergySegmenter:
+    """
+    Split a live mono stream into speech segments using frame energy.
+    Feed arbitrary-sized chunks with process(); completed segments are returned
+    as float32 arrays as soon as enough trailing silence is seen (or the segment
+    reaches max_segment_s). Call flush() at end of stream for the remainder.
+    Like Endpointer, the threshold is raised to noise_ratio x the running noise
+    floor in noisy rooms, so both agree on what counts as speech.
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=30, threshold=0.01,
+                 min_silence_ms=600, min_speech_ms=250, padding_ms=200, max_segment_s=20.0,
+                 noise_ratio=3.0):
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.threshold = threshold
+        self.noise_ratio = noise_ratio
+        self.noise_floor = None
+        self.min_silence_frames = max(1, int(min_silence_ms / frame_ms))
+        self.min_speech_frames = max(1, int(min_speech_ms / frame_ms))
+        self.padding_frames = max(0, int(padding_ms / frame_ms))
+        self.max_segment_frames = max(1, int(max_segment_s * 1000 / frame_ms))
+
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._pre_roll = deque(maxlen=self.padding_frames or 1)
+        self._segment = []
+        self._speech_frames = 0
+        self._silence_run = 0
+        self._in_speech = False
+
+    def process(self, samples: np.ndarray) -> list:
+        samples = np.concatenate([self._pending, np.asarray(samples, dtype=np.float32).reshape(-1)])
+        energies = frame_rms(samples, self.frame_length)
+        consumed = len(energies) * self.frame_length
+        self._pending = samples[consumed:]
+
+        threshold = self.threshold
+        if self.noise_floor is not None:
+            threshold = max(threshold, self.noise_floor * self.noise_ratio)
+        speech = energies >= threshold
+        silent = energies[~speech]
+        if len(silent):
+            level = float(silent.mean())
+            self.noise_floor = level if self.noise_floor is None else 0.9 * self.noise_floor + 0.1 * level
+
+        segments = []
+        for i, is_speech in enumerate(speech):
+            frame = samples[i * self.frame_length:(i + 1) * self.frame_length]
+            if not self._in_speech:
+                if is_speech:
+                    self._in_speech = True
+                    self._segment = list(self._pre_roll) if self.padding_frames else []
+                    self._pre_roll.clear()
+                    self._segment.append(frame)
+                    self._speech_frames = 1
+                    self._silence_run = 0
+                elif self.padding_frames:
+                    self._pre_roll.append(frame)
+                continue
+
+            self._segment.append(frame)
+            if is_speech:
+                self._speech_frames += 1
+                self._silence_run = 0
+            else:
+                self._silence_run += 1
+
+            if self._silence_run >= self.min_silence_frames or len(self._segment) >= self.max_segment_frames:
+                segment = self._close_segment()
+                if segment is not None:
+                    segments.append(segment)
+        return segments
+
+    def flush(self):
+        """Return the in-progress segment (if it holds enough speech) and reset."""
+        if self._in_speech and len(self._pending):
+            self._segment.append(self._pending)
+        self._pending = np.zeros(0, dtype=np.float32)
+        return self._close_segment() if self._in_speech else None
+
+    def _close_segment(self):
+        # Keep at most `padding_frames` of the trailing silence
+        trim = max(0, self._silence_run - self.padding_frames)
+        frames = self._segment[:len(self._segment) - trim] if trim else self._segment
+        enough_speech = self._speech_frames >= self.min_speech_frames
+        self._segment = []
+        self._speech_frames = 0
+        self._silence_run = 0
+        self._in_speech = False
+        if not enough_speech or not frames:
+            return None
+        return np.concatenate(frames)
+
+
+def frame_zcr(samples: np.ndarray, frame_length: int) -> np.ndarray:
+    """Zero-crossing rate (crossings per sample) of each complete frame of `samples`."""
+    n_frames = len(samples) // frame_length
+    if n_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    signs = np.signbit(samples[:n_frames * frame_length].reshape(n_frames, frame_length))
+    return np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1).astype(np.float32) / frame_length
+
+
+class Endpointer:
+    """
+    End-of-utterance detector cheap enough to run inside the audio callback.
+    Each complete frame is classified as speech when its energy clears the
+    threshold (raised to noise_ratio x the running noise floor in noisy rooms)
+    and its zero-crossing rate isn't noise-like; loud frames count regardless
+    of ZCR so fricatives aren't lost. `done` turns True once at least
+    min_speech_ms of speech has been followed by trailing_silence_ms of
+    silence. Short blips followed by silence are forgotten.
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=30, threshold=0.01, zcr_threshold=0.25,
+                 trailing_silence_ms=1200, min_speech_ms=250, noise_ratio=3.0):
+        self.sample_rate = sample_rate
+        self.frame_length = int(sample_rate * frame_ms / 1000)
+        self.threshold = threshold
+        self.zcr_threshold = zcr_threshold
+        self.noise_ratio = noise_ratio
+        self.trailing_silence_frames = max(1, int(trailing_silence_ms / frame_ms))
+        self.min_speech_frames = max(1, int(min_speech_ms / frame_ms))
+        self.noise_floor = None
+        self.done = False
+
+        self._pending = np.zeros(self.frame_length, dtype=np.float32)
+        self._pending_fill = 0
+        self._frames_seen = 0
+        self._first_speech = None  # frame index
+        self._last_speech = None   # frame index just past the latest speech frame
+        self._speech_frames = 0
+
+    def process(self, samples) -> bool:
+        """Feed the next chunk of mono float32 samples; returns `done`."""
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1)
+        length = self.frame_length
+        if self._pending_fill:
+            take = min(len(samples), length - self._pending_fill)
+            self._pending[self._pending_fill:self._pending_fill + take] = samples[:take]
+            self._pending_fill += take
+            samples = samples[take:]
+            if self._pending_fill < length:
+                return self.done
+            self._classify(self._pending)
+            self._pending_fill = 0
+        n_frames = len(samples) // length
+        if n_frames:
+            self._classify(samples[:n_frames * length])
+        rest = len(samples) - n_frames * length
+        if rest:
+            self._pending[:rest] = samples[n_frames * length:]
+            self._pending_fill = rest
+        return self.done
+
+    def _classify(self, samples):
+        energy = frame_rms(samples, self.frame_length)
+        zcr = frame_zcr(samples, self.frame_length)
+        threshold = self.threshold
+        if self.noise_floor is not None:
+            threshold = max(threshold, self.noise_floor * self.noise_ratio)
+        speech = (energy >= threshold) & ((zcr <= self.zcr_threshold) | (energy >= 3 * threshold))
+
+        base = self._frames_seen
+        self._frames_seen += len(energy)
+        silent = energy[~speech]
+        if len(silent):
+            level = float(silent.mean())
+            self.noise_floor = level if self.noise_floor is None else 0.9 * self.noise_floor + 0.1 * level
+        hits = np.flatnonzero(speech)
+        if len(hits):
+            if self._first_speech is None:
+                self._first_speech = base + int(hits[0])
+            self._last_speech = base + int(hits[-1]) + 1
+            self._speech_frames += len(hits)
+        if self._last_speech is not None and self._frames_seen - self._last_speech >= self.trailing_silence_frames:
+            if self._speech_frames >= self.min_speech_frames:
+                self.done = True
+            else:
+                self._first_speech = self._last_speech = None
+                self._speech_frames = 0
+
+    def speech_bounds(self, padding_ms=200):
+        """(start, end) sample offsets of the detected speech, widened by
+        padding_ms on both sides, or None if no utterance was heard."""
+        if self._first_speech is None or self._speech_frames < self.min_speech_frames:
+            return None
+        padding = int(self.sample_rate * padding_ms / 1000)
+        start = max(0, self._first_speech * self.frame_length - padding)
+        end = self._last_speech * self.frame_length + padding
+        return start, end